@@ -1,14 +1,17 @@
 # app.py
-from flask import Flask, render_template, request, redirect, url_for, flash, session, send_from_directory, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, session, send_from_directory, jsonify, g
+from flask import Response, stream_with_context
 import database as db
 import os
+import hmac
+import logging
 from werkzeug.utils import secure_filename
 from flask import send_from_directory
 from functools import wraps
 from datetime import datetime, timedelta
-from werkzeug.security import generate_password_hash, check_password_hash
 import pickle
 import json
+import csv
 
 # NEW IMPORTS FOR GOOGLE LOGIN & 2FA
 from authlib.integrations.flask_client import OAuth
@@ -23,11 +26,13 @@ from database import (
     add_announcement, get_announcements,
     set_weekly_link, get_weekly_link,
     create_attendance_session, close_attendance_session,
-    get_open_attendance_session, mark_attendance, get_attendance_status_for_student
+    get_open_attendance_session, mark_attendance, mark_many_attendance, get_attendance_status_for_student
 )
+from security import normalize_totp_code, get_totp
 
 
 app = Flask(__name__)
+logger = logging.getLogger(__name__)
 
 # -------------------
 # Enhanced Security Configuration for Render
@@ -67,6 +72,18 @@ def set_security_headers(response):
         response.headers['Strict-Transport-Security'] = 'max-age=31536000; includeSubDomains'
     return response
 
+@app.teardown_request
+def drop_db_cache(exc):
+    g.pop('_dbcache', None)
+
+# Audit events attached to g are queued after the response is built
+@app.after_request
+def flush_audit(response):
+    event = getattr(g, 'audit', None)
+    if event:
+        db.log_admin_activity(*event)
+    return response
+
 # Ensure upload directory exists (works on both local and Render)
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
@@ -119,7 +136,7 @@ class Security:
                 login_time = datetime.fromisoformat(session['login_time'])
                 if datetime.now() - login_time > timedelta(hours=2):
                     return False, "Session expired"
-            except:
+            except (TypeError, ValueError):
                 return False, "Invalid session data"
         
         if 'ip_address' in session and session['ip_address'] != request.remote_addr:
@@ -311,43 +328,6 @@ jotform_service = JotFormService()
 # -------------------
 # NEW: Google OAuth and 2FA Routes (Added without affecting existing routes)
 # -------------------
-@app.route('/create-my-admin')
-def create_my_admin():
-    """Temporary route to create hbiuportal@gmail.com admin account"""
-    try:
-        from werkzeug.security import generate_password_hash
-        
-        conn = db.get_db()
-        cursor = conn.cursor()
-        
-        # Check if admin already exists
-        cursor.execute("SELECT * FROM admins WHERE email = %s", ('hbiuportal@gmail.com',))
-        existing_admin = cursor.fetchone()
-        
-        if existing_admin:
-            return "✅ Admin hbiuportal@gmail.com already exists"
-        
-        # Create new admin account
-        hashed_pw = generate_password_hash('#Ausbildung2025')
-        cursor.execute(
-            "INSERT INTO admins (email, password, role) VALUES (%s, %s, %s)",
-            ('hbiuportal@gmail.com', hashed_pw, 'super_admin')
-        )
-        conn.commit()
-        conn.close()
-        
-        return """
-        ✅ Admin account created successfully!
-        Email: hbiuportal@gmail.com
-        Password: #Ausbildung2025
-        Role: super_admin
-        
-        You can now login at /admin/login
-        """
-        
-    except Exception as e:
-        return f"❌ Error creating admin: {str(e)}"
-
 @app.route('/login/google')
 def google_login():
     """Initiate Google OAuth login - NEW ROUTE"""
@@ -427,24 +407,25 @@ def complete_google_registration():
     college = request.form.get('college')
     
     # Create student account with random password
-    if db.create_student(
+    student_id = db.create_student(
         name=google_user['name'],
         email=google_user['email'],
         admission_no=admission_no,
-        password=generate_password_hash(os.urandom(24).hex()),
+        # Never used to log in; create_student hashes it once with Argon2
+        password=os.urandom(24).hex(),
         college=college
-    ):
+    )
+    if student_id:
         # Link Google account
-        student = db.get_student_by_email(google_user['email'])
-        db.update_student_google_id(student['id'], google_user['sub'])
+        db.update_student_google_id(student_id, google_user['sub'])
         
         session.pop('google_user', None)
         
         # Auto-login and redirect to 2FA setup
-        session['user_id'] = student['id']
+        session['user_id'] = student_id
         session['user_type'] = 'student'
-        session['user_email'] = student['email']
-        session['user_name'] = student['name']
+        session['user_email'] = google_user['email']
+        session['user_name'] = google_user['name']
         
         flash('Registration successful! Please setup 2FA for security.', 'success')
         return redirect(url_for('setup_2fa'))
@@ -490,15 +471,14 @@ def verify_2fa_setup():
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
-    totp_code = request.form.get('totp_code')
+    totp_code = normalize_totp_code(request.form.get('totp_code'))
     totp_secret = session.get('pending_totp_secret')
     
     if not totp_secret:
         flash('Session expired. Please try again.', 'error')
         return redirect(url_for('setup_2fa'))
     
-    totp = pyotp.TOTP(totp_secret)
-    if totp.verify(totp_code):
+    if get_totp(totp_secret).verify(totp_code, valid_window=1):
         # Save TOTP secret to database
         db.update_totp_secret(session['user_type'], session['user_id'], totp_secret)
         session.pop('pending_totp_secret', None)
@@ -515,7 +495,7 @@ def verify_2fa():
         return render_template('verify_2fa.html')
     
     # POST request - verify code
-    totp_code = request.form.get('totp_code')
+    totp_code = normalize_totp_code(request.form.get('totp_code'))
     pre_2fa_user = session.get('pre_2fa_user')
     
     if not pre_2fa_user:
@@ -526,8 +506,7 @@ def verify_2fa():
     totp_secret = db.get_totp_secret(pre_2fa_user['type'], pre_2fa_user['id'])
     
     if totp_secret:
-        totp = pyotp.TOTP(totp_secret)
-        if totp.verify(totp_code):
+        if get_totp(totp_secret).verify(totp_code, valid_window=1):
             # 2FA successful, log user in
             session['user_id'] = pre_2fa_user['id']
             session['user_type'] = pre_2fa_user['type']
@@ -686,7 +665,14 @@ def register_unit():
         return redirect(url_for('login'))
     
     unit_code = request.form['code']
-    if db.register_student_unit(session['user_id'], unit_code):
+    codes = [code.strip() for code in unit_code.split(',') if code.strip()]
+    if len(codes) > 1:
+        added = db.bulk_register_student_units(session['user_id'], codes)
+        if added:
+            flash(f'{added} unit(s) registered successfully!', 'success')
+        else:
+            flash('Invalid unit codes or already registered', 'danger')
+    elif db.register_student_unit(session['user_id'], unit_code.strip()):
         flash('Unit registered successfully!', 'success')
     else:
         flash('Invalid unit code or already registered', 'danger')
@@ -884,6 +870,29 @@ def api_mark_attendance(session_id):
     except Exception as e:
         return jsonify(ok=False, error=str(e)), 500
 
+# Lecturer: mark a list of students present (class roll / manual entry)
+@app.post("/api/attendance/<int:session_id>/mark-many")
+def api_mark_many_attendance(session_id):
+    try:
+        lecturer_id = session.get("lecturer_id")
+        if not lecturer_id:
+            return jsonify(ok=False, error="Not authorized"), 401
+
+        payload = request.get_json(silent=True) or {}
+        student_ids = payload.get("student_ids") or request.form.getlist("student_ids")
+        try:
+            student_ids = [int(sid) for sid in student_ids]
+        except (TypeError, ValueError):
+            return jsonify(ok=False, error="student_ids must be integers"), 400
+
+        added, error = mark_many_attendance(session_id, lecturer_id, student_ids)
+        if error:
+            status = {"Session not found": 404, "Not your session": 403, "Session is closed": 409}.get(error, 500)
+            return jsonify(ok=False, error=error), status
+        return jsonify(ok=True, added=added)
+    except Exception as e:
+        return jsonify(ok=False, error=str(e)), 500
+
 
 
 @app.route('/unit/<int:unit_id>/learn')
@@ -894,71 +903,25 @@ def learning_interface(unit_id):
         flash('Unit not found', 'danger')
         return redirect(url_for('home'))
 
-    # Helper function to convert tuple to dict
-    def convert_to_dict(data, fields=None):
-        """Convert tuple to dictionary using field names"""
-        if hasattr(data, 'get') and callable(data.get):
-            return data  # Already a dict-like object
-        elif isinstance(data, (tuple, list)):
-            # Common field order for items: id, title, content, order_index, type, chapter_id, etc.
-            if fields:
-                return dict(zip(fields, data))
-            else:
-                # Default field mapping based on common database structure
-                default_fields = ['id', 'title', 'content', 'order_index', 'type', 'chapter_id', 'instructions', 'duration', 'video_url', 'video_file', 'attachment_filename']
-                return dict(zip(default_fields[:len(data)], data))
-        return data
-
-    # Helper function for safe order_index extraction
-    def get_order_index(item):
-        item_dict = convert_to_dict(item)
-        return item_dict.get('order_index', 0)
-
-    # Helper function for safe chapter order_index extraction
-    def get_chapter_order_index(chapter):
-        chapter_dict = convert_to_dict(chapter)
-        return chapter_dict.get('order_index', 0)
-
-    # Helper function to safely get values
-    def safe_get(data, key, default=None):
-        data_dict = convert_to_dict(data)
-        return data_dict.get(key, default)
-
-    # Chapters (sorted if order_index exists) - FIXED
-    chapters = db.get_unit_chapters(unit_id) or []
-    
-    # Convert chapters to dictionaries and sort
-    chapters_dicts = [convert_to_dict(chapter, ['id', 'title', 'description', 'order_index', 'unit_id']) for chapter in chapters]
-    chapters_dicts.sort(key=get_chapter_order_index)
-
-    # Progress (students only)
+    # Chapters -> items -> completion in a single query
     is_student = ('user_id' in session and session.get('user_type') == 'student')
-    progress_data = db.get_student_progress(session['user_id'], unit_id) if is_student else {}
-    progress_data = progress_data or {}
+    chapters_dicts = db.get_unit_learning_tree(unit_id, session['user_id'] if is_student else None)
+    progress_data = {it['id']: it['completed'] for ch in chapters_dicts for it in ch['items']}
 
     total_items = 0
     completed_items = 0
     completed_chapters = 0
     has_exam_item = False
 
-    # Attach items and compute progress (non-exam only) - FIXED
+    # Compute progress (non-exam only)
     for ch in chapters_dicts:
-        chapter_id = safe_get(ch, 'id')
-        items = db.get_chapter_items(chapter_id) or []
-        
-        # Convert items to dictionaries and sort
-        items_dicts = [convert_to_dict(item) for item in items]
-        items_dicts.sort(key=get_order_index)
+        items_dicts = ch['items']
 
         # NEW: Track chapter completion
         chapter_completed = True
         
         for it in items_dicts:
-            item_id = safe_get(it, 'id')
-            it['completed'] = bool(progress_data.get(item_id, False))
-            
-            item_type = safe_get(it, 'type')
-            if item_type == 'exam':
+            if it['type'] == 'exam':
                 has_exam_item = True
             else:
                 total_items += 1
@@ -971,10 +934,11 @@ def learning_interface(unit_id):
         if chapter_completed and len(items_dicts) > 0:  # Only count if chapter has items and all are completed
             completed_chapters += 1
 
-        ch['items'] = items_dicts
-
     # If you don't persist an exam item, synthesize one
     if not has_exam_item:
+        if is_student:
+            # The synthetic exam has no chapter_items row, so its progress is not in the tree
+            progress_data.update(db.get_student_progress(session['user_id'], unit_id) or {})
         chapters_dicts.append({
             'id': -99999,
             'title': 'Final Examination',
@@ -1039,12 +1003,20 @@ def update_progress():
         
         # Update progress in database
         try:
-            success = db.update_student_progress(
-                session['user_id'], 
-                unit_id, 
-                item_id, 
-                completed
-            )
+            if data.get('items'):
+                # Several ticks in one request share a single upsert and commit
+                success = db.update_student_progress_bulk(
+                    session['user_id'],
+                    unit_id,
+                    [(it.get('item_id'), it.get('completed')) for it in data['items']]
+                )
+            else:
+                success = db.update_student_progress(
+                    session['user_id'], 
+                    unit_id, 
+                    item_id, 
+                    completed
+                )
             if success:
                 return jsonify({'success': True})
             else:
@@ -1059,11 +1031,17 @@ def unit_results(unit_id):
         return redirect(url_for('login'))
     
     if request.method == 'POST':
-        student_id = request.form['student_id']
-        score = request.form['score']
-        remarks = request.form.get('remarks', '')
-        
-        if db.update_student_result(student_id, unit_id, score, remarks):
+        student_ids = request.form.getlist('student_id')
+        scores = request.form.getlist('score')
+        remarks = request.form.getlist('remarks') or [''] * len(student_ids)
+        
+        # A bulk grade sheet posts one student_id/score/remarks per row; save them in one commit
+        if not (len(student_ids) == len(scores) == len(remarks)):
+            flash('Every result row needs a student, a score and remarks', 'danger')
+            return redirect(url_for('unit_results', unit_id=unit_id))
+        rows = [(student_id, unit_id, score, remark)
+                for student_id, score, remark in zip(student_ids, scores, remarks)]
+        if rows and db.update_student_results_bulk(rows):
             flash('Result updated successfully!', 'success')
         else:
             flash('Error updating result', 'danger')
@@ -1109,9 +1087,7 @@ def api_get_curriculum(unit_id):
     if not unit:
         return jsonify({'ok': False, 'error': 'Unit not found'}), 404
 
-    chapters = db.get_unit_chapters(unit_id) or []
-    for ch in chapters:
-        ch['items'] = db.get_chapter_items(ch['id']) or []
+    chapters = db.get_unit_learning_tree(unit_id)
     return jsonify({'ok': True, 'chapters': chapters})
 
 @app.route('/api/unit/<int:unit_id>/chapter', methods=['POST'])
@@ -1237,42 +1213,6 @@ def api_create_item(unit_id):
     except Exception as e:
         print(f"DEBUG - Error verifying chapter: {e}")
 
-    # Find next order_index inside this chapter - FIXED THE MAIN ISSUE
-    items = db.get_chapter_items(chapter_id) or []
-    
-    # Debug the items structure to understand the data format
-    print(f"DEBUG - Items type: {type(items)}")
-    if items:
-        print(f"DEBUG - First item type: {type(items[0])}")
-        print(f"DEBUG - First item structure: {items[0]}")
-    
-    # Robust order_index calculation that handles both dicts and tuples
-    def get_order_index(item):
-        if hasattr(item, 'get') and callable(item.get):
-            # It's a dictionary-like object
-            return item.get('order_index', 0)
-        elif isinstance(item, (tuple, list)):
-            # It's a tuple/list - try to find order_index position
-            # Common positions: if it's (id, title, content, order_index, ...)
-            if len(item) > 3:
-                return item[3] or 0  # Assuming order_index is at position 3
-            elif len(item) > 0:
-                return item[0] or 0  # Fallback to first element
-        return 0
-
-    try:
-        if items:
-            order_indices = [get_order_index(item) for item in items]
-            print(f"DEBUG - Extracted order indices: {order_indices}")
-            next_idx = max(order_indices) + 1
-        else:
-            next_idx = 1
-    except Exception as e:
-        print(f"DEBUG - Error calculating next_idx: {e}")
-        next_idx = 1  # Fallback
-
-    print(f"DEBUG - Next order index: {next_idx}")
-
     # Handle file uploads with better error handling
     video_filename = None
     notes_filename = None
@@ -1334,7 +1274,7 @@ def api_create_item(unit_id):
             video_file=video_filename,
             instructions=final_instructions,
             duration=duration,
-            order_index=next_idx,
+            order_index=None,  # appended after the chapter's last item
             attachment_filename=attachment_filename
         )
 
@@ -1543,6 +1483,26 @@ def student_results():
 def test():
     return "✅ Flask is working and connected to database!"
 
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+@app.route("/metrics")
+def metrics():
+    """Connection-pool gauges and counters in Prometheus text format"""
+    # Scrapers send "Authorization: Bearer $METRICS_TOKEN"; otherwise only a signed-in admin may look
+    auth = request.headers.get('Authorization', '')
+    token_ok = bool(METRICS_TOKEN) and hmac.compare_digest(auth, f"Bearer {METRICS_TOKEN}")
+    if not token_ok and not ('admin_id' in session and db.get_admin_by_id(session['admin_id'])):
+        return "Unauthorized\n", 401, {'Content-Type': 'text/plain', 'WWW-Authenticate': 'Bearer'}
+    stats = db.get_pool_stats()
+    lines = []
+    for name in ('requested', 'acquired', 'unacquired_error'):
+        lines.append(f"# TYPE db_connections_{name} counter")
+        lines.append(f"db_connections_{name} {stats[name]}")
+    for name in ('pool_size', 'pool_available', 'requests_waiting'):
+        lines.append(f"# TYPE db_{name} gauge")
+        lines.append(f"db_{name} {stats[name]}")
+    return "\n".join(lines) + "\n", 200, {'Content-Type': 'text/plain; version=0.0.4'}
+
 # ---------- EXAM ROUTES ----------
 @app.route('/unit/<int:unit_id>/exam/create', methods=['GET','POST'])
 def exam_create(unit_id):
@@ -1602,15 +1562,11 @@ def exam_landing(unit_id):
         return redirect(url_for('learning_interface', unit_id=unit_id))
 
     # unlocked if 100% progress of non-exam items
-    chapters = db.get_unit_chapters(unit_id) or []
-    for ch in chapters:
-        ch['items'] = db.get_chapter_items(ch['id']) or []
+    student_id = session['user_id'] if session.get('user_type') == 'student' else None
+    chapters = db.get_unit_learning_tree(unit_id, student_id)
     # compute
-    progress_map = {}
-    if 'user_id' in session and session.get('user_type') == 'student':
-        progress_map = db.get_student_progress(session['user_id'], unit_id) or {}
-    total = sum(1 for ch in chapters for it in ch['items'] if it.get('type') != 'exam')
-    done = sum(1 for ch in chapters for it in ch['items'] if it.get('type') != 'exam' and progress_map.get(it['id']))
+    total = sum(1 for ch in chapters for it in ch['items'] if it['type'] != 'exam')
+    done = sum(1 for ch in chapters for it in ch['items'] if it['type'] != 'exam' and it['completed'])
     unlocked = (total>0 and done==total)
 
     return render_template('exam_landing.html', unit=unit, exam=exam, unlocked=unlocked)
@@ -1681,43 +1637,12 @@ def update_profile():
         # Update based on user type using database functions
         success = False
         try:
-            if user_type == 'student':
-                # Use database function to update student profile
-                conn = db.get_db()
-                cursor = conn.cursor()
-                if os.environ.get('DATABASE_URL'):
-                    cursor.execute("UPDATE students SET name = %s, email = %s WHERE id = %s", (name, email, user_id))
+            if user_type in ('student', 'lecturer', 'admin'):
+                db.update_profile(user_type, user_id, name, email)
+                if user_type == 'admin':
+                    session['admin_email'] = email
                 else:
-                    cursor.execute("UPDATE students SET name = ?, email = ? WHERE id = ?", (name, email, user_id))
-                conn.commit()
-                conn.close()
-                session['user_name'] = name
-                success = True
-                
-            elif user_type == 'lecturer':
-                # Use database function to update lecturer profile
-                conn = db.get_db()
-                cursor = conn.cursor()
-                if os.environ.get('DATABASE_URL'):
-                    cursor.execute("UPDATE lecturers SET name = %s, email = %s WHERE id = %s", (name, email, user_id))
-                else:
-                    cursor.execute("UPDATE lecturers SET name = ?, email = ? WHERE id = ?", (name, email, user_id))
-                conn.commit()
-                conn.close()
-                session['user_name'] = name
-                success = True
-                
-            elif user_type == 'admin':
-                # Use database function to update admin email
-                conn = db.get_db()
-                cursor = conn.cursor()
-                if os.environ.get('DATABASE_URL'):
-                    cursor.execute("UPDATE admins SET email = %s WHERE id = %s", (email, user_id))
-                else:
-                    cursor.execute("UPDATE admins SET email = ? WHERE id = ?", (email, user_id))
-                conn.commit()
-                conn.close()
-                session['admin_email'] = email
+                    session['user_name'] = name
                 success = True
             
         except Exception as e:
@@ -1958,7 +1883,7 @@ def update_admin_email():
         
         # Update the admin email
         cursor.execute(
-            "UPDATE admins SET email = %s WHERE email = %s",
+            db.q("UPDATE admins SET email = %s WHERE email = %s"),
             ('hbiuportal@gmail.com', 'admin@hbi.edu')
         )
         conn.commit()
@@ -2150,8 +2075,9 @@ def admin_create_unit():
         title = request.form['title']
         lecturer_id = request.form['lecturer_id']
         
-        if db.create_unit(code, title, lecturer_id):
-            db.log_admin_activity(session['admin_id'], 'create_unit', f'Created unit: {code}')
+        new_unit_id = db.create_unit(code, title, lecturer_id)
+        if new_unit_id:
+            db.log_admin_activity(session['admin_id'], 'create_unit', f'Created unit: {code} (ID: {new_unit_id})')
             flash('Unit created successfully!', 'success')
         else:
             flash('Unit code already exists', 'danger')
@@ -2216,13 +2142,13 @@ def admin_reset_password():
             
             if student:
                 print(f"DEBUG: Attempting to reset student password for ID: {student['id']}")
-                success = db.update_student_password(student['id'], new_password)
+                success = db.update_password('student', student['id'], new_password)
                 user_type = 'student'
                 user_name = student['name']
                 print(f"DEBUG: Student password reset result: {success}")
             else:
                 print(f"DEBUG: Attempting to reset lecturer password for ID: {lecturer['id']}")
-                success = db.update_lecturer_password(lecturer['id'], new_password)
+                success = db.update_password('lecturer', lecturer['id'], new_password)
                 user_type = 'lecturer'
                 user_name = lecturer['name']
                 print(f"DEBUG: Lecturer password reset result: {success}")
@@ -2295,13 +2221,13 @@ def change_password():
         # Update password based on user type
         success = False
         if user_type == 'student':
-            success = db.update_student_password(user_id, new_password)
+            success = db.update_password('student', user_id, new_password)
             user_name = session.get('user_name', 'Student')
         elif user_type == 'lecturer':
-            success = db.update_lecturer_password(user_id, new_password)
+            success = db.update_password('lecturer', user_id, new_password)
             user_name = session.get('user_name', 'Lecturer')
         elif user_type == 'admin':
-            success = db.update_admin_password(user_id, new_password)
+            success = db.update_password('admin', user_id, new_password)
             user_name = session.get('user_name', 'Admin')
             db.log_admin_activity(user_id, 'password_change', 'Password updated successfully')
         
@@ -2320,11 +2246,9 @@ def change_password():
     
     return render_template("change_password.html")
 
-@app.route("/admin/change-password", methods=['GET', 'POST'])
-@admin_required
-def admin_change_password():
-    """Admin-specific password change"""
-    return change_password()
+# Admin-specific password change: same view, guarded by admin_required
+app.add_url_rule("/admin/change-password", 'admin_change_password',
+                 admin_required(change_password), methods=['GET', 'POST'])
 
 # ==================== ADMIN RESULTS ROUTES ====================
 
@@ -2334,6 +2258,39 @@ def admin_results():
     results = db.get_all_results()
     return render_template("admin_results.html", results=results)
 
+def _csv_stream(columns, rows):
+    """Yield CSV text one line at a time for a streamed download"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def line(values):
+        writer.writerow(values)
+        text = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+        return text
+
+    yield line(columns)
+    for row in rows:
+        yield line([row.get(c) for c in columns])
+
+def _csv_response(filename, columns, rows):
+    return Response(stream_with_context(_csv_stream(columns, rows)), mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+@app.route("/admin/results/export")
+@admin_required
+def admin_results_export():
+    columns = ['id', 'student_name', 'admission_no', 'unit_code', 'unit_title',
+               'score', 'remarks', 'lecturer_name', 'created_at']
+    return _csv_response('results.csv', columns, db.iter_all_results())
+
+@app.route("/admin/units/<int:unit_id>/announcements/export")
+@admin_required
+def admin_announcements_export(unit_id):
+    return _csv_response(f'announcements_unit_{unit_id}.csv', list(db.ANNOUNCEMENT_KEYS),
+                         db.iter_all_announcements(unit_id))
+
 @app.route("/admin/results/add", methods=['GET', 'POST'])
 @admin_required
 def admin_results_add():
@@ -2429,10 +2386,16 @@ def admin_activity_log():
     activities = db.get_admin_activity_log(session['admin_id'])
     return render_template("admin_activity_log.html", activities=activities)
 
+@app.route("/admin/activity-log/export")
+@admin_required
+def admin_activity_log_export():
+    columns = ['id', 'admin_id', 'action', 'details', 'timestamp']
+    return _csv_response('activity_log.csv', columns, db.iter_admin_activity_log(session['admin_id']))
+
 @app.route("/admin/logout")
 def admin_logout():
     if 'admin_id' in session:
-        db.log_admin_activity(session['admin_id'], 'logout', 'Admin logged out')
+        g.audit = (session['admin_id'], 'logout', 'Admin logged out')
     
     # Secure session cleanup
     session.clear()
@@ -2462,11 +2425,10 @@ if __name__ == "__main__":
         db.init_db()
     
     # Create default super admin account (run only once)
-    try:
-        db.create_super_admin('admin@hbi.edu', 'Admin123!@#')
+    if db.create_super_admin('admin@hbi.edu', 'Admin123!@#'):
         print("✅ Default super admin account created: admin@hbi.edu / Admin123!@#")
-    except:
-        print("ℹ️ Admin account already exists or error creating admin")
+    else:
+        print("ℹ️ Admin account already exists")
     
     # Render-compatible configuration
     port = int(os.environ.get("PORT", 5000))
@@ -2478,8 +2440,7 @@ else:
     # This runs when using Gunicorn (Render production)
     with app.app_context():
         db.init_db()
-        try:
-            db.create_super_admin('admin@hbi.edu', 'Admin123!@#')
-            print("✅ Database initialized for production")
-        except:
-            print("ℹ️ Database already initialized")
+        if db.create_super_admin('admin@hbi.edu', 'Admin123!@#'):
+            print("✅ Database initialized for production; default super admin created")
+        else:
+            print("✅ Database initialized for production; admin account already exists")
@@ -3,9 +3,9 @@ import pyotp
 import qrcode
 import io
 import base64
-import os
+import secrets
 from database import get_student_by_google_id, get_student_by_email, update_student_google_id, create_student, update_totp_secret, get_totp_secret
-from werkzeug.security import generate_password_hash
+from security import normalize_totp_code, get_totp
 
 def init_auth_routes(app, google_oauth):
     @app.route('/login/google')
@@ -85,7 +85,7 @@ def init_auth_routes(app, google_oauth):
             name=google_user['name'],
             email=google_user['email'],
             admission_no=admission_no,
-            password=generate_password_hash(os.urandom(24).hex()),
+            password=secrets.token_hex(24),
             college=college
         ):
             # Link Google account
@@ -144,15 +144,14 @@ def init_auth_routes(app, google_oauth):
         if 'user_id' not in session:
             return redirect(url_for('login'))
         
-        totp_code = request.form.get('totp_code')
+        totp_code = normalize_totp_code(request.form.get('totp_code'))
         totp_secret = session.get('pending_totp_secret')
         
         if not totp_secret:
             flash('Session expired. Please try again.', 'error')
             return redirect(url_for('setup_2fa'))
         
-        totp = pyotp.TOTP(totp_secret)
-        if totp.verify(totp_code):
+        if get_totp(totp_secret).verify(totp_code, valid_window=1):
             # Save TOTP secret to database
             update_totp_secret(session['user_type'], session['user_id'], totp_secret)
             session.pop('pending_totp_secret', None)
@@ -169,7 +168,7 @@ def init_auth_routes(app, google_oauth):
             return render_template('verify_2fa.html')
         
         # POST request - verify code
-        totp_code = request.form.get('totp_code')
+        totp_code = normalize_totp_code(request.form.get('totp_code'))
         pre_2fa_user = session.get('pre_2fa_user')
         
         if not pre_2fa_user:
@@ -180,8 +179,7 @@ def init_auth_routes(app, google_oauth):
         totp_secret = get_totp_secret(pre_2fa_user['type'], pre_2fa_user['id'])
         
         if totp_secret:
-            totp = pyotp.TOTP(totp_secret)
-            if totp.verify(totp_code):
+            if get_totp(totp_secret).verify(totp_code, valid_window=1):
                 # 2FA successful, log user in
                 session['user_id'] = pre_2fa_user['id']
                 session['user_type'] = pre_2fa_user['type']
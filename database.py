@@ -1,10 +1,33 @@
 import os
 import sqlite3
-from werkzeug.security import generate_password_hash, check_password_hash
+import time
+import atexit
+import threading
+import functools
+import queue
+import hmac
+import hashlib
+import logging
+from logging.handlers import QueueHandler, QueueListener
+from contextlib import contextmanager
+from flask import g, has_request_context
+from security import hash_password, check_password
+from werkzeug.security import generate_password_hash
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import DictCursor
 import json
 
+# Request threads only enqueue log records; a listener thread does the stderr writes
+logger = logging.getLogger(__name__)
+_log_queue = queue.Queue()
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+_log_listener = QueueListener(_log_queue, _log_handler)
+logger.addHandler(QueueHandler(_log_queue))
+logger.propagate = False
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
 # College options
 COLLEGES = [
     "HBIU College of Health Science / addiction training",
@@ -13,408 +36,741 @@ COLLEGES = [
     "HBIU college for behavioral and social science",
     "HBIU college of health, science and public health"
 ]
-def _exec(cursor, sql, params=None):
-    try:
-        cursor.execute(sql, params or ())
-    except Exception as e:
-        # Swallow benign ALTER errors in upgrade steps; re-raise others
-        raise
-
-def _exec_soft(cursor, sql):
-    try:
-        cursor.execute(sql)
-    except Exception:
-        pass
-
-def create_learning_tables():
-    """
-    Core learning/assessment tables (chapters, items, progress, exams).
-    Safe to run multiple times.
-    """
-    conn = get_db()
-    cur = conn.cursor()
-    try:
-        # Common types for both SQLite and PG
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS chapters (
-                id SERIAL PRIMARY KEY,
-                unit_id INTEGER NOT NULL,
-                title VARCHAR(255) NOT NULL,
-                description TEXT,
-                order_index INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS chapter_items (
-                id SERIAL PRIMARY KEY,
-                chapter_id INTEGER NOT NULL,
-                title VARCHAR(255) NOT NULL,
-                type VARCHAR(50) NOT NULL,
-                content TEXT,
-                video_url TEXT,
-                video_file VARCHAR(255),
-                instructions TEXT,
-                duration VARCHAR(50),
-                order_index INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS student_progress (
-                id SERIAL PRIMARY KEY,
-                student_id INTEGER NOT NULL,
-                unit_id INTEGER NOT NULL,
-                item_id INTEGER NOT NULL,
-                completed BOOLEAN DEFAULT FALSE,
-                completed_at TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(student_id, unit_id, item_id)
-            )
-        """)
 
-        # Helpful indexes
-        _exec_soft(cur, "CREATE INDEX IF NOT EXISTS idx_chapters_unit ON chapters(unit_id, order_index)")
-        _exec_soft(cur, "CREATE INDEX IF NOT EXISTS idx_items_chapter ON chapter_items(chapter_id, order_index)")
-        _exec_soft(cur, "CREATE INDEX IF NOT EXISTS idx_progress_student_unit ON student_progress(student_id, unit_id)")
-
-        # Soft add upload columns to chapter_items
-        for ddl in [
-            "ALTER TABLE chapter_items ADD COLUMN notes_file VARCHAR(255)",
-            "ALTER TABLE chapter_items ADD COLUMN quiz_file VARCHAR(255)",
-            "ALTER TABLE chapter_items ADD COLUMN assignment_file VARCHAR(255)"
-        ]:
+SQLITE_PATH = 'hbi_campus.db'
+
+# The deployment shape is fixed for the life of the process
+DATABASE_URL = os.environ.get('DATABASE_URL')
+IS_PG = bool(DATABASE_URL)
+PARAM = '%s' if IS_PG else '?'
+# INSERT ... RETURNING needs SQLite 3.35+; older builds fall back to cursor.lastrowid
+HAS_RETURNING = IS_PG or sqlite3.sqlite_version_info >= (3, 35, 0)
+NOW = 'NOW()' if IS_PG else "datetime('now')"
+
+def q(sql):
+    """Adapt a statement written for Postgres (%s placeholders, NOW()) to the active driver"""
+    if IS_PG:
+        return sql
+    return sql.replace('%s', '?').replace('NOW()', "datetime('now')")
+
+# Backend-specific helpers are picked here once rather than branching on every call
+if IS_PG:
+    def _in_filter(column, values):
+        """WHERE fragment and params matching column against any of values"""
+        return f"{column} = ANY(%s)", (list(values),)
+else:
+    def _in_filter(column, values):
+        """WHERE fragment and params matching column against any of values"""
+        return f"{column} IN (" + ", ".join("?" * len(values)) + ")", tuple(values)
+
+_sqlite_wal_enabled = False
+
+def _connect_sqlite():
+    """Open a SQLite connection for the pool; its PRAGMAs are applied once here, not per call"""
+    global _sqlite_wal_enabled
+    # Pooled connections move between request threads, one user at a time
+    conn = sqlite3.connect(SQLITE_PATH, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    if SQLITE_PATH != ':memory:':
+        # journal_mode is persisted in the database file, so set it once per process
+        if not _sqlite_wal_enabled:
+            conn.execute("PRAGMA journal_mode=WAL")
+            _sqlite_wal_enabled = True
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA mmap_size=268435456")
+    conn.execute("PRAGMA busy_timeout=30000")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-64000")
+    conn.execute("PRAGMA foreign_keys=ON")
+    return conn
+
+OPTIMIZE_INTERVAL = 900  # seconds between background PRAGMA optimize runs
+_last_optimize = 0.0
+
+def _run_optimize():
+    """Refresh SQLite planner statistics on a dedicated connection"""
+    try:
+        conn = sqlite3.connect(SQLITE_PATH)
+        try:
+            # A plain PRAGMA optimize only looks at tables this connection has queried, which on
+            # a fresh connection is none. 0x10000 (SQLite 3.46+) makes it consider every table;
+            # older builds get a sampled ANALYZE instead
+            if sqlite3.sqlite_version_info >= (3, 46, 0):
+                conn.execute("PRAGMA optimize=0x10002")
+            else:
+                conn.execute("PRAGMA analysis_limit=400")
+                conn.execute("ANALYZE")
+        finally:
+            conn.close()
+    except Exception as e:
+        logger.warning("PRAGMA optimize failed: %s", e)
+
+def _maybe_optimize():
+    """Kick off PRAGMA optimize in the background at most every OPTIMIZE_INTERVAL"""
+    global _last_optimize
+    if SQLITE_PATH == ':memory:':
+        return
+    now = time.time()
+    if now - _last_optimize > OPTIMIZE_INTERVAL:
+        _last_optimize = now
+        threading.Thread(target=_run_optimize, daemon=True).start()
+
+@atexit.register
+def _optimize_on_exit():
+    if not IS_PG and SQLITE_PATH != ':memory:' and _last_optimize:
+        _run_optimize()
+
+POOL_MIN_SIZE = 2
+# Per process; keep POOL_MAX_SIZE x workers under the server's max_connections
+POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX', 10))
+# libpq options for every pooled connection: TCP keepalives notice sockets the load balancer
+# dropped within ~1 minute instead of waiting out a retransmit timeout, and the name labels
+# our sessions in pg_stat_activity
+PG_CONNECT_OPTIONS = {
+    'sslmode': 'require',
+    'application_name': 'hbi-campus',
+    'keepalives': 1,
+    'keepalives_idle': 30,
+    'keepalives_interval': 10,
+    'keepalives_count': 3,
+}
+# Connections idle longer than this are probed with SELECT 1 before being handed out
+POOL_IDLE_CHECK = 60  # seconds
+_pg_pool = None
+_pg_pool_lock = threading.Lock()
+
+# Pool checkout counters, exposed through get_pool_stats()
+POOL_SAMPLE_INTERVAL = 60  # seconds
+POOL_WAITING_ALERT_SAMPLES = 3
+_pool_metrics = {'requested': 0, 'acquired': 0, 'unacquired_error': 0, 'waiting': 0}
+_pool_metrics_lock = threading.Lock()
+
+class _PooledConnection:
+    """Pooled connection whose close() hands it back to the pool"""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            _release_pg(self._pool, conn)
+
+    def discard(self):
+        """Drop a connection that may be broken instead of returning it for reuse"""
+        if self._conn is not None:
             try:
-                cur.execute(ddl)
+                self._conn.close()
             except Exception:
                 pass
+        self.close()
 
-        # Exams
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS exams (
-                id SERIAL PRIMARY KEY,
-                unit_id INTEGER NOT NULL,
-                title VARCHAR(255) NOT NULL,
-                description TEXT,
-                duration_minutes INTEGER DEFAULT 60,
-                total_marks INTEGER DEFAULT 100,
-                pass_marks INTEGER DEFAULT 0,
-                unlock_after_count INTEGER DEFAULT 10,
-                is_published BOOLEAN DEFAULT FALSE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS exam_questions (
-                id SERIAL PRIMARY KEY,
-                exam_id INTEGER NOT NULL,
-                question_text TEXT NOT NULL,
-                type VARCHAR(20) DEFAULT 'mcq',
-                points INTEGER DEFAULT 1,
-                order_index INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS exam_options (
-                id SERIAL PRIMARY KEY,
-                question_id INTEGER NOT NULL,
-                option_text TEXT NOT NULL,
-                is_correct BOOLEAN DEFAULT FALSE
-            )
-        """)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS exam_attempts (
-                id SERIAL PRIMARY KEY,
-                exam_id INTEGER NOT NULL,
-                student_id INTEGER NOT NULL,
-                started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                submitted_at TIMESTAMP,
-                score INTEGER DEFAULT 0,
-                status VARCHAR(20) DEFAULT 'in_progress'
-            )
-        """)
-        # Soft add JSON answers column to attempts
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if self._conn is not None:
+                if exc_type is None:
+                    self._conn.commit()
+                else:
+                    self._conn.rollback()
+        finally:
+            self.close()
+        return False
+
+class _PreparingConnection(psycopg2.extensions.connection):
+    """psycopg2 connection that remembers which statements it has PREPAREd"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+        self.last_used = time.monotonic()
+
+def _get_pg_pool(database_url):
+    """Create the process-wide Postgres pool on first use"""
+    global _pg_pool
+    if _pg_pool is None:
+        with _pg_pool_lock:
+            if _pg_pool is None:
+                from psycopg2.pool import ThreadedConnectionPool
+                _pg_pool = ThreadedConnectionPool(POOL_MIN_SIZE, POOL_MAX_SIZE, database_url,
+                                                  cursor_factory=DictCursor,
+                                                  connection_factory=_PreparingConnection,
+                                                  **PG_CONNECT_OPTIONS)
+                threading.Thread(target=_monitor_pg_pool, daemon=True).start()
+    return _pg_pool
+
+def _count_pool(key, delta=1):
+    with _pool_metrics_lock:
+        _pool_metrics[key] += delta
+
+def _getconn_checked(pool):
+    """psycopg2 getconn() that replaces a long-idle connection if it no longer answers"""
+    while True:
+        conn = pool.getconn()
+        if conn.closed == 0 and time.monotonic() - conn.last_used <= POOL_IDLE_CHECK:
+            return conn
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            pool.putconn(conn, close=True)
+
+def _checkout_pg(pool):
+    """Check a connection out of the pool, recording request/acquire/error counts"""
+    _count_pool('requested')
+    _count_pool('waiting')
+    try:
+        conn = _getconn_checked(pool)
+    except Exception:
+        _count_pool('unacquired_error')
+        raise
+    finally:
+        _count_pool('waiting', -1)
+    _count_pool('acquired')
+    return conn
+
+def get_pool_stats():
+    """Snapshot of Postgres pool size/availability plus checkout counters"""
+    with _pool_metrics_lock:
+        stats = dict(_pool_metrics)
+    pool = _pg_pool
+    if pool is None:
+        stats.update(pool_size=0, pool_available=0, requests_waiting=0)
+    else:
+        # psycopg2 keeps idle connections in _pool and checked-out ones in _used
+        stats.update(pool_size=len(pool._pool) + len(pool._used),
+                     pool_available=len(pool._pool),
+                     requests_waiting=stats['waiting'])
+    del stats['waiting']
+    return stats
+
+def _monitor_pg_pool():
+    """Sample the pool periodically and warn when checkouts keep queueing"""
+    waiting_samples = 0
+    last_errors = 0
+    while True:
+        time.sleep(POOL_SAMPLE_INTERVAL)
+        try:
+            stats = get_pool_stats()
+        except Exception as e:
+            logger.warning("Could not sample connection pool: %s", e)
+            continue
+        # psycopg2 pools fail fast instead of queueing, so new errors count as saturation too
+        saturated = stats['requests_waiting'] > 0 or stats['unacquired_error'] > last_errors
+        last_errors = stats['unacquired_error']
+        waiting_samples = waiting_samples + 1 if saturated else 0
+        if waiting_samples >= POOL_WAITING_ALERT_SAMPLES:
+            logger.warning("Database pool saturated for %s samples: %s", waiting_samples, stats)
+
+def _release_pg(pool, conn):
+    """Return a connection to the pool, discarding it if it is no longer usable"""
+    if hasattr(pool, 'closeall'):
+        # psycopg2 pools hand back connections as-is, so end any open transaction first;
+        # the SQLite pool's putconn() does its own rollback
         try:
-            cur.execute("ALTER TABLE exam_attempts ADD COLUMN answers_json TEXT")
+            if not conn.closed:
+                conn.rollback()
         except Exception:
             pass
+        conn.last_used = time.monotonic()
+        pool.putconn(conn, close=bool(conn.closed))
+    else:
+        pool.putconn(conn)
 
-        _exec_soft(cur, "CREATE INDEX IF NOT EXISTS idx_exam_unit ON exams(unit_id)")
-        _exec_soft(cur, "CREATE INDEX IF NOT EXISTS idx_q_exam ON exam_questions(exam_id, order_index)")
-        _exec_soft(cur, "CREATE INDEX IF NOT EXISTS idx_attempt_exam_student ON exam_attempts(exam_id, student_id)")
+SQLITE_POOL_SIZE = 5
 
-        conn.commit()
-        print("✅ Learning & exam tables created/updated successfully")
-    except Exception as e:
-        conn.rollback()
-        print("❌ Error creating/upgrading learning tables:", e)
-    finally:
-        conn.close()
+class _SQLitePool:
+    """Keeps up to SQLITE_POOL_SIZE open SQLite connections so their page cache stays warm"""
 
+    def __init__(self, size):
+        self._idle = queue.LifoQueue(maxsize=size)
 
-def get_db():
-    """Get database connection - supports both SQLite and PostgreSQL"""
-    database_url = os.environ.get('DATABASE_URL')
-    
-    if database_url:
-        # PostgreSQL (Production - Render) using psycopg3
+    def getconn(self):
         try:
-            import psycopg
-            conn = psycopg.connect(database_url, sslmode='require')
-            return conn
-        except ImportError:
-            # Fallback to psycopg2 if psycopg3 not available
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return _connect_sqlite()
+
+    def putconn(self, conn):
+        try:
+            conn.rollback()
+            self._idle.put_nowait(conn)
+        except (queue.Full, sqlite3.Error):
+            conn.close()
+
+    def close(self):
+        while True:
             try:
-                import psycopg2
-                conn = psycopg2.connect(database_url, sslmode='require')
-                return conn
-            except:
-                # Final fallback to SQLite
-                conn = sqlite3.connect('hbi_campus.db')
-                conn.row_factory = sqlite3.Row
-                return conn
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+_sqlite_pool = _SQLitePool(SQLITE_POOL_SIZE)
+
+@atexit.register
+def _close_pools():
+    """Close idle pooled connections at shutdown, after the activity log flush has run"""
+    if _pg_pool is not None:
+        _pg_pool.closeall()
+    _sqlite_pool.close()
+
+def _get_sqlite():
+    if SQLITE_PATH == ':memory:':
+        # Every in-memory connection is its own database; nothing to share
+        return _connect_sqlite()
+    # Checked on every checkout: a warm pool rarely opens new connections
+    _maybe_optimize()
+    return _PooledConnection(_sqlite_pool, _sqlite_pool.getconn())
+
+def get_db():
+    """Get database connection - supports both SQLite and PostgreSQL"""
+    if IS_PG:
+        # PostgreSQL (Production - Render) from a shared pool; close() returns it.
+        # Pool and connection errors propagate: quietly switching to a local SQLite file would
+        # serve empty reads and lose writes on the next deploy
+        pool = _get_pg_pool(DATABASE_URL)
+        return _PooledConnection(pool, _checkout_pg(pool))
     else:
-        # SQLite (Development - Local)
-        conn = sqlite3.connect('hbi_campus.db')
-        conn.row_factory = sqlite3.Row
-        return conn
+        # SQLite (Development - Local), also pooled; close() returns it
+        return _get_sqlite()
 
-def create_learning_tables():
-    """Create/upgrade tables for the learning interface (chapters, items, progress, exams)."""
+@contextmanager
+def db_cursor():
+    """Yield (conn, cursor); rolls back on error and always hands the connection back"""
     conn = get_db()
-    cursor = conn.cursor()
-
     try:
-        # ---- Core learning tables ----
-        # Chapters
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS chapters (
-                id SERIAL PRIMARY KEY,
-                unit_id INTEGER NOT NULL,
-                title VARCHAR(255) NOT NULL,
-                description TEXT,
-                order_index INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
+        yield conn, conn.cursor()
+    except Exception as e:
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        # A dropped server connection must not go back into the pool
+        if isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError)) and hasattr(conn, 'discard'):
+            conn.discard()
+        raise
+    finally:
+        conn.close()
 
-        # Chapter items (lesson, quiz, assignment, exam-placeholder)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS chapter_items (
-                id SERIAL PRIMARY KEY,
-                chapter_id INTEGER NOT NULL,
-                title VARCHAR(255) NOT NULL,
-                type VARCHAR(50) NOT NULL,        -- 'lesson', 'quiz', 'assignment', 'exam'
-                content TEXT,                     -- generic rich text / HTML
-                video_url TEXT,
-                video_file VARCHAR(255),
-                instructions TEXT,                -- for assignments/quizzes
-                duration VARCHAR(50),             -- e.g. '15 min'
-                order_index INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
+STREAM_PAGE_SIZE = 2000
 
-        # Student progress
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS student_progress (
-                id SERIAL PRIMARY KEY,
-                student_id INTEGER NOT NULL,
-                unit_id INTEGER NOT NULL,
-                item_id INTEGER NOT NULL,
-                completed BOOLEAN DEFAULT FALSE,
-                completed_at TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(student_id, unit_id, item_id)
-            )
-        """)
+def _iter_rows(sql, params, cursor_name, label):
+    """Yield rows as dicts, through a server-side cursor when connected to Postgres.
+    Errors are logged and re-raised, so a streamed export aborts instead of ending early."""
+    try:
+        with db_cursor() as (conn, cursor):
+            if not isinstance(cursor, sqlite3.Cursor):
+                # A named cursor keeps the result set on the server and fetches itersize rows at a time
+                cursor = conn.cursor(cursor_name)
+                cursor.itersize = STREAM_PAGE_SIZE
+            cursor.execute(sql, params)
+            for row in cursor:
+                yield dict(row)
+    except Exception as e:
+        logger.error("Error in %s: %s", label, e)
+        raise
 
-        # Helpful indexes
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_chapters_unit ON chapters(unit_id, order_index)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_items_chapter ON chapter_items(chapter_id, order_index)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_progress_student_unit ON student_progress(student_id, unit_id)")
-
-        # Non-breaking upgrades to chapter_items (file columns)
-        for ddl in [
-            "ALTER TABLE chapter_items ADD COLUMN notes_file VARCHAR(255)",
-            "ALTER TABLE chapter_items ADD COLUMN quiz_file VARCHAR(255)",
-            "ALTER TABLE chapter_items ADD COLUMN assignment_file VARCHAR(255)"
-        ]:
+def _request_cached(fn):
+    """Memoize a single-row lookup on flask.g for the rest of the current request"""
+    @functools.wraps(fn)
+    def wrap(*args):
+        if not has_request_context():
+            return fn(*args)
+        cache = g.setdefault('_dbcache', {})
+        key = (fn.__name__, args)
+        if key not in cache:
+            cache[key] = fn(*args)
+        return cache[key]
+    return wrap
+
+def invalidate(fn, *args):
+    """Drop a cached lookup for this request; with no args, every entry of fn"""
+    if not has_request_context():
+        return
+    cache = g.get('_dbcache')
+    if not cache:
+        return
+    if args:
+        cache.pop((fn.__name__, args), None)
+    else:
+        for key in [k for k in cache if k[0] == fn.__name__]:
+            del cache[key]
+
+# Unit and lecturer listings change rarely; each worker process keeps them for a short TTL
+SHARED_CACHE_TTL = int(os.environ.get('SHARED_CACHE_TTL', 60))
+EXAM_CACHE_TTL = 30
+WEEKLY_LINK_CACHE_TTL = 30
+# Short, so a session opened by another worker shows up within a few seconds
+OPEN_SESSION_CACHE_TTL = 5
+_shared_cache = {}
+_shared_cache_lock = threading.Lock()
+
+def _copy_cached(value):
+    """Copy cached rows on the way out so callers can't edit the cached ones"""
+    if isinstance(value, list):
+        return [dict(row) for row in value]
+    if isinstance(value, dict):
+        return dict(value)
+    return value
+
+def _ttl_cached(seconds, error_value=None):
+    """Cache a lookup across requests for `seconds`, keyed on its positional arguments.
+
+    The wrapped function raises on database errors; those are logged and answered with
+    error_value but never cached, so one failed query doesn't read as "no rows" for the TTL.
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrap(*args):
+            key = (fn.__name__, args)
+            now = time.monotonic()
+            with _shared_cache_lock:
+                hit = _shared_cache.get(key)
+            if hit and now < hit[0]:
+                return _copy_cached(hit[1])
             try:
-                cursor.execute(ddl)
-            except Exception:
-                pass  # already exists
-
-        # ---- Exam tables ----
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS exams (
-                id SERIAL PRIMARY KEY,
-                unit_id INTEGER NOT NULL,
-                title VARCHAR(255) NOT NULL,
-                description TEXT,
-                duration_minutes INTEGER DEFAULT 60,
-                total_marks INTEGER DEFAULT 100,
-                pass_marks INTEGER DEFAULT 0,
-                unlock_after_count INTEGER DEFAULT 10,
-                is_published BOOLEAN DEFAULT FALSE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
+                value = fn(*args)
+            except Exception as e:
+                logger.error("Error in %s: %s", fn.__name__, e)
+                return _copy_cached(error_value)
+            with _shared_cache_lock:
+                # Drop expired entries as we go so per-id keys don't pile up forever
+                for stale in [k for k, (expires, _) in _shared_cache.items() if expires <= now]:
+                    del _shared_cache[stale]
+                _shared_cache[key] = (now + seconds, value)
+            return _copy_cached(value)
+        return wrap
+    return decorate
+
+_shared_cached = _ttl_cached(SHARED_CACHE_TTL, error_value=[])
+
+def invalidate_shared(*fns):
+    """Drop every cached entry of fns after a write that changes them"""
+    names = {fn.__name__ for fn in fns}
+    with _shared_cache_lock:
+        for key in [k for k in _shared_cache if k[0] in names]:
+            del _shared_cache[key]
+
+def invalidate_shared_key(fn, *args):
+    """Drop the cached entry of fn for one set of arguments"""
+    with _shared_cache_lock:
+        _shared_cache.pop((fn.__name__, args), None)
+
+USER_TABLES = {'student': 'students', 'lecturer': 'lecturers', 'admin': 'admins'}
+# Keyed by table name; built once so the helpers below never format SQL per call
+SQL_SET_PASSWORD = {t: q(f"UPDATE {t} SET password = %s WHERE id = %s") for t in USER_TABLES.values()}
+SQL_GET_PASSWORD = {t: q(f"SELECT password FROM {t} WHERE id = %s") for t in USER_TABLES.values()}
+SQL_SET_TOTP_SECRET = {t: q(f"UPDATE {t} SET totp_secret = %s WHERE id = %s") for t in USER_TABLES.values()}
+# Admins have no name column
+SQL_UPDATE_PROFILE = {
+    'students': q("UPDATE students SET name = %s, email = %s WHERE id = %s"),
+    'lecturers': q("UPDATE lecturers SET name = %s, email = %s WHERE id = %s"),
+    'admins': q("UPDATE admins SET email = %s WHERE id = %s"),
+}
+
+# Hot single-row lookups run on every authenticated request; on Postgres they are PREPAREd
+# once per pooled connection.
+PREPARED_SQL = {
+    'get_student_by_email': f"""
+        SELECT id, name, email, admission_no, college, created_at, google_id, totp_secret
+        FROM students WHERE email = {PARAM}
+    """,
+    'get_student_by_google_id': f"""
+        SELECT id, name, email, admission_no, college, created_at, google_id, totp_secret
+        FROM students WHERE google_id = {PARAM}
+    """,
+    'get_student_totp': f"SELECT totp_secret FROM students WHERE id = {PARAM}",
+    'get_lecturer_totp': f"SELECT totp_secret FROM lecturers WHERE id = {PARAM}",
+    'get_admin_totp': f"SELECT totp_secret FROM admins WHERE id = {PARAM}",
+    'get_unit_by_id': f"SELECT id, code, title, lecturer_id FROM units WHERE id = {PARAM}",
+    # Session user lookups run on nearly every request. None of these profile lookups select the
+    # password hash: login goes through SQL_VERIFY_USER and password checks through SQL_GET_PASSWORD
+    'get_admin_by_id': f"SELECT id, email, role FROM admins WHERE id = {PARAM}",
+    'get_student_by_id': f"SELECT id, name, email, admission_no, college FROM students WHERE id = {PARAM}",
+    'get_lecturer_by_id': f"SELECT id, name, email FROM lecturers WHERE id = {PARAM}",
+}
+
+def _execute_prepared(cursor, name, params):
+    """Run a PREPARED_SQL statement, as a server-side prepared statement on psycopg2"""
+    sql = PREPARED_SQL[name]
+    prepared = getattr(cursor.connection, 'prepared', None)
+    if prepared is None:
+        cursor.execute(sql, params)
+        return
+    if name not in prepared:
+        numbered = sql
+        for n in range(1, len(params) + 1):
+            numbered = numbered.replace('%s', f'${n}', 1)
+        cursor.execute(f"PREPARE {name} AS {numbered}")
+        prepared.add(name)
+    cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+
+def _ddl(sql):
+    """Adapt Postgres DDL for SQLite: SERIAL must become INTEGER PRIMARY KEY to get generated ids"""
+    if IS_PG:
+        return sql
+    return sql.replace('SERIAL PRIMARY KEY', 'INTEGER PRIMARY KEY AUTOINCREMENT')
+
+def _execute_ddl(cursor, statements):
+    """Run schema statements; Postgres gets them as one semicolon-joined round trip"""
+    if IS_PG:
+        cursor.execute(";\n".join(statements))
+    else:
+        for sql in statements:
+            cursor.execute(sql)
+
+def _sqlite_add_missing_columns(cursor, table, columns):
+    """SQLite has no ADD COLUMN IF NOT EXISTS: check table_info and only ALTER for missing columns"""
+    cursor.execute(f"PRAGMA table_info({table})")
+    existing = {row[1] for row in cursor.fetchall()}
+    for name, col_type in columns:
+        if name not in existing:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {col_type}")
+
+def create_learning_tables(conn):
+    """Create/upgrade tables for the learning interface (chapters, items, progress, exams) on init_db's connection."""
+    cursor = conn.cursor()
+
+    # ---- Core learning tables ----
+    # Chapters
+    cursor.execute(_ddl("""
+        CREATE TABLE IF NOT EXISTS chapters (
+            id SERIAL PRIMARY KEY,
+            unit_id INTEGER NOT NULL,
+            title VARCHAR(255) NOT NULL,
+            description TEXT,
+            order_index INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """))
+
+    # Chapter items (lesson, quiz, assignment, exam-placeholder)
+    cursor.execute(_ddl("""
+        CREATE TABLE IF NOT EXISTS chapter_items (
+            id SERIAL PRIMARY KEY,
+            chapter_id INTEGER NOT NULL,
+            title VARCHAR(255) NOT NULL,
+            type VARCHAR(50) NOT NULL,        -- 'lesson', 'quiz', 'assignment', 'exam'
+            content TEXT,                     -- generic rich text / HTML
+            video_url TEXT,
+            video_file VARCHAR(255),
+            instructions TEXT,                -- for assignments/quizzes
+            duration VARCHAR(50),             -- e.g. '15 min'
+            order_index INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """))
+
+    # Student progress
+    cursor.execute(_ddl("""
+        CREATE TABLE IF NOT EXISTS student_progress (
+            id SERIAL PRIMARY KEY,
+            student_id INTEGER NOT NULL,
+            unit_id INTEGER NOT NULL,
+            item_id INTEGER NOT NULL,
+            completed BOOLEAN DEFAULT FALSE,
+            completed_at TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(student_id, unit_id, item_id)
+        )
+    """))
 
+    # Helpful indexes
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_chapters_unit ON chapters(unit_id, order_index)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_items_chapter ON chapter_items(chapter_id, order_index)")
+    # Covering index for get_student_progress (student_id, unit_id -> item_id, completed)
+    if IS_PG:
         cursor.execute("""
-            CREATE TABLE IF NOT EXISTS exam_questions (
-                id SERIAL PRIMARY KEY,
-                exam_id INTEGER NOT NULL,
-                question_text TEXT NOT NULL,
-                type VARCHAR(20) DEFAULT 'mcq',      -- 'mcq' | 'short'
-                points INTEGER DEFAULT 1,
-                order_index INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
+            CREATE INDEX IF NOT EXISTS idx_progress_covering
+            ON student_progress(student_id, unit_id) INCLUDE (item_id, completed)
         """)
-
+    else:
+        # SQLite has no INCLUDE; trailing key columns give the same index-only lookup
         cursor.execute("""
-            CREATE TABLE IF NOT EXISTS exam_options (
-                id SERIAL PRIMARY KEY,
-                question_id INTEGER NOT NULL,
-                option_text TEXT NOT NULL,
-                is_correct BOOLEAN DEFAULT FALSE
-            )
+            CREATE INDEX IF NOT EXISTS idx_progress_covering
+            ON student_progress(student_id, unit_id, item_id, completed)
         """)
+    # Superseded by idx_progress_covering
+    cursor.execute("DROP INDEX IF EXISTS idx_progress_student_unit")
 
-        # IMPORTANT: exam_attempts must have answers_json since save_exam_attempt_and_score uses it
+    # Non-breaking upgrades to chapter_items (file columns)
+    if IS_PG:
         cursor.execute("""
-            CREATE TABLE IF NOT EXISTS exam_attempts (
-                id SERIAL PRIMARY KEY,
-                exam_id INTEGER NOT NULL,
-                student_id INTEGER NOT NULL,
-                started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                submitted_at TIMESTAMP,
-                score INTEGER DEFAULT 0,
-                status VARCHAR(20) DEFAULT 'in_progress'
-            )
+            ALTER TABLE chapter_items
+                ADD COLUMN IF NOT EXISTS notes_file VARCHAR(255),
+                ADD COLUMN IF NOT EXISTS quiz_file VARCHAR(255),
+                ADD COLUMN IF NOT EXISTS assignment_file VARCHAR(255)
         """)
-        # Add answers_json if missing
-        try:
-            cursor.execute("ALTER TABLE exam_attempts ADD COLUMN answers_json TEXT")
-        except Exception:
-            pass
-
-        # Indexes
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_exam_unit ON exams(unit_id)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_q_exam ON exam_questions(exam_id, order_index)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_attempt_exam_student ON exam_attempts(exam_id, student_id)")
-
-        conn.commit()
-        print("✅ Learning & exam tables created/updated successfully")
+    else:
+        _sqlite_add_missing_columns(cursor, 'chapter_items', [
+            ('notes_file', 'VARCHAR(255)'),
+            ('quiz_file', 'VARCHAR(255)'),
+            ('assignment_file', 'VARCHAR(255)')
+        ])
+
+    # ---- Exam tables ----
+    cursor.execute(_ddl("""
+        CREATE TABLE IF NOT EXISTS exams (
+            id SERIAL PRIMARY KEY,
+            unit_id INTEGER NOT NULL,
+            title VARCHAR(255) NOT NULL,
+            description TEXT,
+            duration_minutes INTEGER DEFAULT 60,
+            total_marks INTEGER DEFAULT 100,
+            pass_marks INTEGER DEFAULT 0,
+            unlock_after_count INTEGER DEFAULT 10,
+            is_published BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """))
+
+    cursor.execute(_ddl("""
+        CREATE TABLE IF NOT EXISTS exam_questions (
+            id SERIAL PRIMARY KEY,
+            exam_id INTEGER NOT NULL,
+            question_text TEXT NOT NULL,
+            type VARCHAR(20) DEFAULT 'mcq',      -- 'mcq' | 'short'
+            points INTEGER DEFAULT 1,
+            order_index INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """))
+
+    cursor.execute(_ddl("""
+        CREATE TABLE IF NOT EXISTS exam_options (
+            id SERIAL PRIMARY KEY,
+            question_id INTEGER NOT NULL,
+            option_text TEXT NOT NULL,
+            is_correct BOOLEAN DEFAULT FALSE
+        )
+    """))
+
+    # IMPORTANT: exam_attempts must have answers_json since save_exam_attempt_and_score uses it
+    cursor.execute(_ddl("""
+        CREATE TABLE IF NOT EXISTS exam_attempts (
+            id SERIAL PRIMARY KEY,
+            exam_id INTEGER NOT NULL,
+            student_id INTEGER NOT NULL,
+            started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            submitted_at TIMESTAMP,
+            score INTEGER DEFAULT 0,
+            status VARCHAR(20) DEFAULT 'in_progress'
+        )
+    """))
+    # Add answers_json if missing
+    if IS_PG:
+        cursor.execute("ALTER TABLE exam_attempts ADD COLUMN IF NOT EXISTS answers_json TEXT")
+    else:
+        _sqlite_add_missing_columns(cursor, 'exam_attempts', [('answers_json', 'TEXT')])
 
-    except Exception as e:
-        print(f"❌ Error creating/upgrading learning tables: {e}")
-        conn.rollback()
-    finally:
-        conn.close()
+    # Indexes
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_exam_unit ON exams(unit_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_q_exam ON exam_questions(exam_id, order_index)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_attempt_exam_student ON exam_attempts(exam_id, student_id)")
+    print("✅ Learning & exam tables created/updated successfully")
 
-def _create_announcements_and_attendance():
+def _create_announcements_and_attendance(conn):
     """
     New tables for:
       - announcements (lecturer -> students)
       - weekly_links (per-unit weekly class link)
       - attendance_sessions (open/close windows)
       - attendance_marks (students marking present)
-    Safe to run repeatedly.
+    Safe to run repeatedly. Runs on init_db's connection and transaction.
     """
-    conn = get_db()
     cursor = conn.cursor()
-    try:
-        # Announcements
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS announcements (
-                id SERIAL PRIMARY KEY,
-                unit_id INTEGER NOT NULL,
-                lecturer_id INTEGER,
-                title TEXT,
-                body TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_ann_unit_created ON announcements(unit_id, created_at DESC)")
-
-        # Weekly class link (single current link per unit)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS weekly_links (
-                unit_id INTEGER PRIMARY KEY,
-                url TEXT,
-                updated_by INTEGER,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
 
-        # Attendance session (open window)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS attendance_sessions (
-                id SERIAL PRIMARY KEY,
-                unit_id INTEGER NOT NULL,
-                lecturer_id INTEGER,
-                week_label TEXT,    -- e.g. 'Week 3' (optional)
-                opened_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                closes_at TIMESTAMP,
-                is_open BOOLEAN DEFAULT TRUE
-            )
-        """)
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_att_sess_unit_open ON attendance_sessions(unit_id, is_open)")
+    # Announcements
+    cursor.execute(_ddl("""
+        CREATE TABLE IF NOT EXISTS announcements (
+            id SERIAL PRIMARY KEY,
+            unit_id INTEGER NOT NULL,
+            lecturer_id INTEGER,
+            title TEXT,
+            body TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """))
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ann_unit_created ON announcements(unit_id, created_at DESC)")
+
+    # Weekly class link (single current link per unit)
+    cursor.execute(_ddl("""
+        CREATE TABLE IF NOT EXISTS weekly_links (
+            unit_id INTEGER PRIMARY KEY,
+            url TEXT,
+            updated_by INTEGER,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """))
+
+    # Attendance session (open window)
+    cursor.execute(_ddl("""
+        CREATE TABLE IF NOT EXISTS attendance_sessions (
+            id SERIAL PRIMARY KEY,
+            unit_id INTEGER NOT NULL,
+            lecturer_id INTEGER,
+            week_label TEXT,    -- e.g. 'Week 3' (optional)
+            opened_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            closes_at TIMESTAMP,
+            is_open BOOLEAN DEFAULT TRUE
+        )
+    """))
+    # opened_at lets the newest-open-session lookup stop at the first index entry
+    cursor.execute("DROP INDEX IF EXISTS idx_att_sess_unit_open")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_att_sess_unit_open_time ON attendance_sessions(unit_id, is_open, opened_at DESC)")
+
+    # Student marks inside a session
+    cursor.execute(_ddl("""
+        CREATE TABLE IF NOT EXISTS attendance_marks (
+            id SERIAL PRIMARY KEY,
+            session_id INTEGER NOT NULL,
+            student_id INTEGER NOT NULL,
+            marked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(session_id, student_id)
+        )
+    """))
+    # UNIQUE(session_id, student_id) already indexes session lookups and the has-marked probe
+    cursor.execute("DROP INDEX IF EXISTS idx_att_mark_session")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_att_mark_student ON attendance_marks(student_id)")
 
-        # Student marks inside a session
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS attendance_marks (
-                id SERIAL PRIMARY KEY,
-                session_id INTEGER NOT NULL,
-                student_id INTEGER NOT NULL,
-                marked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(session_id, student_id)
-            )
-        """)
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_att_mark_session ON attendance_marks(session_id)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_att_mark_student ON attendance_marks(student_id)")
+    print("✅ Announcements, weekly_links, and attendance tables ensured.")
 
-        conn.commit()
-        print("✅ Announcements, weekly_links, and attendance tables ensured.")
-    except Exception as e:
-        print(f"❌ Error creating announcements/attendance tables: {e}")
-        conn.rollback()
-    finally:
-        conn.close()
 def get_conn():
     # If you already have get_db()/get_conn() use that
     return sqlite3.connect("database.db")  # placeholder
 
-def row_to_dict(cur, row):
-    return {d[0]: row[i] for i, d in enumerate(cur.description)}
+SQL_GET_LEARNING_ITEM = q("""
+    SELECT ci.id, c.unit_id, ci.chapter_id, ci.type, ci.title, ci.content,
+           ci.instructions, ci.duration, ci.video_url, ci.video_file,
+           ci.notes_file, ci.quiz_file, ci.assignment_file
+    FROM chapter_items ci
+    JOIN chapters c ON c.id = ci.chapter_id
+    WHERE ci.id = %s AND c.unit_id = %s
+""")
 
 def get_learning_item(unit_id, item_id):
     """
-    Expects a table like learning_items with columns:
-    id, unit_id, chapter_id, type ('lesson'/'quiz'/'assignment'/'exam'),
-    title, content, content_html, instructions, duration, points, total_points,
-    due_at, submission_format, video_url, questions_json (optional)
+    Fetch one chapter item, checked against the unit it belongs to.
+    Columns: id, unit_id, chapter_id, type ('lesson'/'quiz'/'assignment'/'exam'),
+    title, content, instructions, duration, video_url, video_file,
+    notes_file, quiz_file, assignment_file
     """
-    conn = get_conn()
-    conn.row_factory = None
-    cur = conn.cursor()
     try:
-        cur.execute("""
-            SELECT *
-            FROM learning_items
-            WHERE id = ? AND unit_id = ?
-            """, (item_id, unit_id))
-        row = cur.fetchone()
-        if not row:
-            return None
-        data = row_to_dict(cur, row)
-        return data
-    finally:
-        cur.close()
-        conn.close()
+        with db_cursor() as (conn, cur):
+            cur.execute(SQL_GET_LEARNING_ITEM, (item_id, unit_id))
+            row = cur.fetchone()
+            return dict(row) if row else None
+    except Exception as e:
+        logger.error("Error getting learning item: %s", e)
+        return None
 
 def get_learning_item_attachments(item_id):
     """
@@ -467,12 +823,26 @@ def parse_quiz_questions(item_row):
     except Exception:
         return []
 
+# Arbitrary key for the transaction-level advisory lock that serialises init_db across workers
+BOOTSTRAP_LOCK_ID = 872634
+
 def init_db():
-    """Initialize database tables"""
+    """Initialize database tables and the default admin in one transaction"""
     conn = get_db()
     cursor = conn.cursor()
     
     try:
+        # Python's sqlite3 autocommits DDL unless a transaction is opened explicitly;
+        # IMMEDIATE takes the write lock up front so concurrent boots queue instead of deadlocking
+        if not IS_PG:
+            cursor.execute("BEGIN IMMEDIATE")
+        else:
+            # Workers booting together wait here and then find the schema already in place,
+            # instead of racing on CREATE TABLE and the admin INSERT; released at commit
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", (BOOTSTRAP_LOCK_ID,))
+            # Give up on a busy table rather than queue every reader behind a waiting ALTER
+            cursor.execute("SET LOCAL lock_timeout = '2s'")
+
         tables_sql = [
             # Students
             '''
@@ -520,6 +890,7 @@ def init_db():
                 code TEXT UNIQUE NOT NULL,
                 title TEXT NOT NULL,
                 lecturer_id INTEGER,
+                lesson_count INTEGER NOT NULL DEFAULT 0,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
             ''',
@@ -618,81 +989,147 @@ def init_db():
             '''
         ]
         
-        for sql in tables_sql:
-            try:
-                cursor.execute(sql)
-            except Exception as e:
-                print(f"⚠️ Table creation warning: {e}")
-                continue
-        
-        conn.commit()
-        print("✅ Database tables initialized successfully")
+        # units.lesson_count is maintained by add_lesson/delete_lesson; resync it on every start
+        # Only rows that drifted are written, so a normal start locks and rewrites nothing
+        resync_lesson_count = """
+            UPDATE units SET lesson_count = (SELECT COUNT(*) FROM lessons WHERE lessons.unit_id = units.id)
+            WHERE lesson_count <> (SELECT COUNT(*) FROM lessons WHERE lessons.unit_id = units.id)
+        """
+
+        # email/google_id on students, lecturers and admins, and the (student_id, unit_id) pairs on
+        # student_units and results (which also serve student_id-only lookups), are already
+        # indexed by their UNIQUE constraints
+        core_indexes = [
+            "CREATE INDEX IF NOT EXISTS idx_student_units_unit ON student_units(unit_id, student_id)",
+            "CREATE INDEX IF NOT EXISTS idx_units_lecturer ON units(lecturer_id)",
+            "CREATE INDEX IF NOT EXISTS idx_activities_unit_due ON activities(unit_id, due_date)",
+            "CREATE INDEX IF NOT EXISTS idx_resources_unit ON resources(unit_id, uploaded_at)",
+            "CREATE INDEX IF NOT EXISTS idx_lessons_unit ON lessons(unit_id, created_at)",
+            "CREATE INDEX IF NOT EXISTS idx_quizzes_unit ON quizzes(unit_id, created_at)",
+            "CREATE INDEX IF NOT EXISTS idx_assignments_unit ON assignments(unit_id, created_at)",
+            "CREATE INDEX IF NOT EXISTS idx_admin_log_admin_time ON admin_activity_log(admin_id, timestamp)",
+            "CREATE INDEX IF NOT EXISTS idx_admin_log_time ON admin_activity_log(timestamp)",
+        ]
+
+        # All schema DDL runs in one transaction: one commit, and all-or-nothing on failure
+        schema = [_ddl(sql) for sql in tables_sql]
+        if IS_PG:
+            _execute_ddl(cursor, schema + [
+                "ALTER TABLE units ADD COLUMN IF NOT EXISTS lesson_count INTEGER NOT NULL DEFAULT 0",
+                resync_lesson_count,
+            ] + core_indexes)
+        else:
+            _execute_ddl(cursor, schema)
+            _sqlite_add_missing_columns(cursor, 'units', [('lesson_count', 'INTEGER NOT NULL DEFAULT 0')])
+            _execute_ddl(cursor, [resync_lesson_count] + core_indexes)
 
         # Create learning + exams and fixes
-        create_learning_tables()
+        create_learning_tables(conn)
 
         # New sets: announcements + attendance + weekly link
-        _create_announcements_and_attendance()
-        
+        _create_announcements_and_attendance(conn)
+
         # Ensure default admin
-        create_default_admin()
-        
+        _seed_default_admin(cursor)
+
+        conn.commit()
+        print("✅ Database tables initialized successfully")
+    except RuntimeError:
+        # Missing seed password in production: fail startup rather than seed a known password
+        conn.rollback()
+        raise
     except Exception as e:
-        print(f"❌ Database initialization error: {e}")
+        logger.error("Database initialization error: %s", e)
         conn.rollback()
     finally:
         conn.close()
 
+def _seed_admin_hash():
+    """Password hash for the seeded admin, from SEED_ADMIN_PASSWORD_HASH or SEED_ADMIN_PASSWORD"""
+    seed_hash = os.environ.get('SEED_ADMIN_PASSWORD_HASH')
+    if seed_hash:
+        return seed_hash
+    seed_password = os.environ.get('SEED_ADMIN_PASSWORD')
+    if seed_password:
+        return hash_password(seed_password)
+    if IS_PG:
+        raise RuntimeError("Set SEED_ADMIN_PASSWORD or SEED_ADMIN_PASSWORD_HASH to create the default admin")
+    logger.warning("SEED_ADMIN_PASSWORD not set - seeding the local admin with the development password")
+    # Well-known dev password: a cheap PBKDF2 hash keeps local boots fast, and the first
+    # login upgrades it to Argon2 through _rehash_password
+    return generate_password_hash('#Ausbildung2025', method='pbkdf2:sha256:100000')
+
+SQL_SEED_ADMIN = q("INSERT INTO admins (email, password, role) VALUES (%s, %s, %s) ON CONFLICT (email) DO NOTHING")
+
+def _seed_default_admin(cursor):
+    """Insert the hbiuportal@gmail.com admin on the caller's transaction if it is missing"""
+    # Keep the existing row (and its id/password); only hash when it is missing
+    cursor.execute(SQL_ADMIN_EXISTS, ('hbiuportal@gmail.com',))
+    if cursor.fetchone():
+        return
+    cursor.execute(SQL_SEED_ADMIN, ('hbiuportal@gmail.com', _seed_admin_hash(), 'super_admin'))
+    print("✅ Admin account created: hbiuportal@gmail.com")
+
 def create_default_admin():
     """Ensure hbiuportal@gmail.com admin account exists"""
     conn = get_db()
     cursor = conn.cursor()
     
     try:
-        cursor.execute("DELETE FROM admins WHERE email = %s", ('hbiuportal@gmail.com',))
-        hashed_pw = generate_password_hash('#Ausbildung2025')
-        cursor.execute(
-            "INSERT INTO admins (email, password, role) VALUES (%s, %s, %s)",
-            ('hbiuportal@gmail.com', hashed_pw, 'super_admin')
-        )
+        _seed_default_admin(cursor)
         conn.commit()
-        print("✅ Admin account ensured: hbiuportal@gmail.com / #Ausbildung2025")
+    except RuntimeError:
+        # Missing seed password in production: fail startup rather than seed a known password
+        raise
     except Exception as e:
-        print(f"Error ensuring admin: {e}")
+        logger.error("Error ensuring admin: %s", e)
         conn.rollback()
     finally:
         conn.close()
 
 # ==================== LEARNING INTERFACE FUNCTIONS ====================
 
+# Built once so every call sends byte-identical SQL: sqlite3's per-connection statement
+# cache is keyed on the text
+SQL_GET_CHAPTERS = f"""
+    SELECT id, unit_id, title, description, order_index, created_at
+    FROM chapters WHERE unit_id = {PARAM} ORDER BY order_index
+"""
+SQL_GET_ITEMS = f"""
+    SELECT id, chapter_id, title, type, content, video_url, video_file, instructions, duration,
+           order_index, notes_file, quiz_file, assignment_file
+    FROM chapter_items WHERE chapter_id = {PARAM} ORDER BY order_index
+"""
+SQL_GET_PROGRESS = f"SELECT item_id, completed FROM student_progress WHERE student_id = {PARAM} AND unit_id = {PARAM}"
+SQL_GET_LEARNING_TREE = f"""
+    SELECT c.id AS chapter_id, c.unit_id, c.title AS chapter_title, c.description AS chapter_description,
+           c.order_index AS chapter_order_index, c.created_at AS chapter_created_at,
+           ci.id AS item_id, ci.title AS item_title, ci.type, ci.content, ci.video_url, ci.video_file,
+           ci.instructions, ci.duration, ci.order_index AS item_order_index,
+           ci.notes_file, ci.quiz_file, ci.assignment_file, sp.completed
+    FROM chapters c
+    LEFT JOIN chapter_items ci ON ci.chapter_id = c.id
+    LEFT JOIN student_progress sp
+           ON sp.student_id = {PARAM} AND sp.unit_id = c.unit_id AND sp.item_id = ci.id
+    WHERE c.unit_id = {PARAM}
+    ORDER BY c.order_index, c.id, ci.order_index, ci.id
+"""
+SQL_UPSERT_PROGRESS = f"""
+    INSERT INTO student_progress (student_id, unit_id, item_id, completed, updated_at)
+    VALUES ({PARAM}, {PARAM}, {PARAM}, {PARAM}, CURRENT_TIMESTAMP)
+    ON CONFLICT (student_id, unit_id, item_id)
+    DO UPDATE SET completed = excluded.completed, updated_at = CURRENT_TIMESTAMP
+"""
+
 def get_unit_chapters(unit_id):
     """Get all chapters for a unit - returns list of dictionaries"""
     conn = get_db()
     cursor = conn.cursor()
     try:
-        if os.environ.get('DATABASE_URL'):
-            cursor.execute("SELECT * FROM chapters WHERE unit_id = %s ORDER BY order_index", (unit_id,))
-        else:
-            cursor.execute("SELECT * FROM chapters WHERE unit_id = ? ORDER BY order_index", (unit_id,))
-        
-        chapters = cursor.fetchall()
-        chapter_list = []
-        for chapter in chapters:
-            if hasattr(chapter, 'keys'):
-                chapter_list.append(dict(chapter))
-            else:
-                chapter_dict = {
-                    'id': chapter[0],
-                    'unit_id': chapter[1],
-                    'title': chapter[2],
-                    'description': chapter[3],
-                    'order_index': chapter[4] if len(chapter) > 4 else 0,
-                    'created_at': chapter[5] if len(chapter) > 5 else None
-                }
-                chapter_list.append(chapter_dict)
-        return chapter_list
+        cursor.execute(SQL_GET_CHAPTERS, (unit_id,))
+        return [dict(chapter) for chapter in cursor.fetchall()]
     except Exception as e:
-        print(f"Error getting chapters: {e}")
+        logger.error("Error getting chapters: %s", e)
         return []
     finally:
         conn.close()
@@ -702,14 +1139,16 @@ def get_chapter_items(chapter_id):
     conn = get_db()
     cursor = conn.cursor()
     try:
-        if os.environ.get('DATABASE_URL'):
-            cursor.execute("SELECT * FROM chapter_items WHERE chapter_id = %s ORDER BY order_index", (chapter_id,))
-        else:
-            cursor.execute("SELECT * FROM chapter_items WHERE chapter_id = ? ORDER BY order_index", (chapter_id,))
-        items = cursor.fetchall()
+        cursor.execute(SQL_GET_ITEMS, (chapter_id,))
+        # Convert in batches so raw rows and their dicts are never both fully materialised
+        items = []
+        rows = cursor.fetchmany(200)
+        while rows:
+            items.extend(dict(row) for row in rows)
+            rows = cursor.fetchmany(200)
         return items
     except Exception as e:
-        print(f"Error getting chapter items: {e}")
+        logger.error("Error getting chapter items: %s", e)
         return []
     finally:
         conn.close()
@@ -719,73 +1158,141 @@ def get_student_progress(student_id, unit_id):
     conn = get_db()
     cursor = conn.cursor()
     try:
-        if os.environ.get('DATABASE_URL'):
-            cursor.execute("SELECT item_id, completed FROM student_progress WHERE student_id = %s AND unit_id = %s", (student_id, unit_id))
-        else:
-            cursor.execute("SELECT item_id, completed FROM student_progress WHERE student_id = ? AND unit_id = ?", (student_id, unit_id))
-        progress = cursor.fetchall()
-        progress_dict = {}
-        for item in progress:
-            if hasattr(item, 'keys'):
-                progress_dict[item['item_id']] = item['completed']
-            else:
-                progress_dict[item[0]] = item[1]
-        return progress_dict
+        cursor.execute(SQL_GET_PROGRESS, (student_id, unit_id))
+        return {item['item_id']: item['completed'] for item in cursor.fetchall()}
     except Exception as e:
-        print(f"Error getting student progress: {e}")
+        logger.error("Error getting student progress: %s", e)
         return {}
     finally:
         conn.close()
 
+def get_unit_learning_tree(unit_id, student_id=None):
+    """Chapters of a unit with their items and the student's completion, in one query"""
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(SQL_GET_LEARNING_TREE, (student_id, unit_id))
+        chapters = {}
+        for row in cursor.fetchall():
+            chapter = chapters.get(row['chapter_id'])
+            if chapter is None:
+                chapter = chapters[row['chapter_id']] = {
+                    'id': row['chapter_id'],
+                    'unit_id': row['unit_id'],
+                    'title': row['chapter_title'],
+                    'description': row['chapter_description'],
+                    'order_index': row['chapter_order_index'],
+                    'created_at': row['chapter_created_at'],
+                    'items': []
+                }
+            if row['item_id'] is not None:
+                chapter['items'].append({
+                    'id': row['item_id'],
+                    'chapter_id': row['chapter_id'],
+                    'title': row['item_title'],
+                    'type': row['type'],
+                    'content': row['content'],
+                    'video_url': row['video_url'],
+                    'video_file': row['video_file'],
+                    'instructions': row['instructions'],
+                    'duration': row['duration'],
+                    'order_index': row['item_order_index'],
+                    'notes_file': row['notes_file'],
+                    'quiz_file': row['quiz_file'],
+                    'assignment_file': row['assignment_file'],
+                    'completed': bool(row['completed'])
+                })
+        return list(chapters.values())
+    except Exception as e:
+        logger.error("Error getting learning tree: %s", e)
+        return []
+    finally:
+        conn.close()
+
 def update_student_progress(student_id, unit_id, item_id, completed):
     """Update student progress for an item"""
     try:
-        conn = get_db()
-        cursor = conn.cursor()
-        if os.environ.get('DATABASE_URL'):
-            cursor.execute("""
-                INSERT INTO student_progress (student_id, unit_id, item_id, completed, updated_at) 
-                VALUES (%s, %s, %s, %s, NOW())
-                ON CONFLICT (student_id, unit_id, item_id) 
-                DO UPDATE SET completed = %s, updated_at = NOW()
-            """, (student_id, unit_id, item_id, completed, completed))
-        else:
-            cursor.execute("""
-                INSERT OR REPLACE INTO student_progress 
-                (student_id, unit_id, item_id, completed, updated_at) 
-                VALUES (?, ?, ?, ?, datetime('now'))
-            """, (student_id, unit_id, item_id, completed))
-        conn.commit()
+        with db_cursor() as (conn, cursor):
+            cursor.execute(SQL_UPSERT_PROGRESS, (student_id, unit_id, item_id, completed))
+            conn.commit()
         return True
     except Exception as e:
-        print(f"Error updating progress: {e}")
+        logger.error("Error updating progress: %s", e)
         return False
-    finally:
-        conn.close()
-
-# ==================== CHAPTER AND ITEM MANAGEMENT ====================
 
-def add_chapter(unit_id, title, description="", order_index=1):
-    """Add a new chapter to a unit"""
+def update_student_progress_bulk(student_id, unit_id, items):
+    """Upsert several (item_id, completed) pairs with one statement and one commit"""
+    # ON CONFLICT cannot touch the same row twice in one statement, so keep the last value per item
+    latest = dict(items)
+    if not latest:
+        return True
     conn = get_db()
     cursor = conn.cursor()
     try:
-        if os.environ.get('DATABASE_URL'):
-            cursor.execute(
-                "INSERT INTO chapters (unit_id, title, description, order_index) VALUES (%s, %s, %s, %s) RETURNING id",
-                (unit_id, title, description, order_index)
-            )
-            chapter_id = cursor.fetchone()[0]
-        else:
-            cursor.execute(
-                "INSERT INTO chapters (unit_id, title, description, order_index) VALUES (?, ?, ?, ?)",
-                (unit_id, title, description, order_index)
-            )
-            chapter_id = cursor.lastrowid
+        row_sql = f"({PARAM}, {PARAM}, {PARAM}, {PARAM}, CURRENT_TIMESTAMP)"
+        cursor.execute(f"""
+            INSERT INTO student_progress (student_id, unit_id, item_id, completed, updated_at)
+            VALUES {', '.join([row_sql] * len(latest))}
+            ON CONFLICT (student_id, unit_id, item_id)
+            DO UPDATE SET completed = excluded.completed, updated_at = CURRENT_TIMESTAMP
+        """, [value for item_id, completed in latest.items() for value in (student_id, unit_id, item_id, completed)])
+        conn.commit()
+        return True
+    except Exception as e:
+        logger.error("Error updating progress: %s", e)
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+# ==================== CHAPTER AND ITEM MANAGEMENT ====================
+
+def _insert_returning_id(cursor, sql, params):
+    """Run a single-row INSERT and return the new row's id"""
+    if HAS_RETURNING:
+        cursor.execute(sql + " RETURNING id", params)
+        return cursor.fetchone()[0]
+    cursor.execute(sql, params)
+    return cursor.lastrowid
+
+BULK_INSERT_PAGE_SIZE = 500
+
+def _insert_rows(cursor, table, columns, rows, row_sql=None, suffix='', page_size=BULK_INSERT_PAGE_SIZE):
+    """Insert rows with one multi-row VALUES statement per page; returns the inserted row count"""
+    row_sql = row_sql or "(" + ", ".join([PARAM] * len(columns)) + ")"
+    inserted = 0
+    for start in range(0, len(rows), page_size):
+        page = rows[start:start + page_size]
+        cursor.execute(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES {', '.join([row_sql] * len(page))} {suffix}",
+            [value for row in page for value in row]
+        )
+        inserted += cursor.rowcount
+    return inserted
+
+SQL_ADD_CHAPTER = q("INSERT INTO chapters (unit_id, title, description, order_index) VALUES (%s, %s, %s, %s)")
+# Without an explicit position, append after the chapter's last item in the same statement
+SQL_ADD_CHAPTER_ITEM = q("""
+    INSERT INTO chapter_items (chapter_id, title, type, content, video_url, video_file, instructions, duration, order_index, notes_file, quiz_file, assignment_file)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s,
+            COALESCE(%s, (SELECT COALESCE(MAX(order_index), 0) + 1 FROM chapter_items WHERE chapter_id = %s)),
+            %s, %s, %s)
+""")
+
+def add_chapter(unit_id, title, description="", order_index=1):
+    """Add a new chapter to a unit"""
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        chapter_id = _insert_returning_id(
+            cursor,
+            SQL_ADD_CHAPTER,
+            (unit_id, title, description, order_index)
+        )
         conn.commit()
         return chapter_id
     except Exception as e:
-        print(f"Error adding chapter: {e}")
+        logger.error("Error adding chapter: %s", e)
         conn.rollback()
         return None
     finally:
@@ -796,13 +1303,6 @@ def add_chapter_item(chapter_id, title, type, content='', video_url='', video_fi
     conn = get_db()
     cursor = conn.cursor()
     try:
-        if order_index is None:
-            if os.environ.get('DATABASE_URL'):
-                cursor.execute("SELECT COUNT(*) FROM chapter_items WHERE chapter_id = %s", (chapter_id,))
-            else:
-                cursor.execute("SELECT COUNT(*) FROM chapter_items WHERE chapter_id = ?", (chapter_id,))
-            order_index = cursor.fetchone()[0] + 1
-        
         notes_file = None
         quiz_file = None
         assignment_file = None
@@ -814,216 +1314,225 @@ def add_chapter_item(chapter_id, title, type, content='', video_url='', video_fi
         elif type == 'assignment' and attachment_filename:
             assignment_file = attachment_filename
         
-        if os.environ.get('DATABASE_URL'):
-            cursor.execute("""
-                INSERT INTO chapter_items (chapter_id, title, type, content, video_url, video_file, instructions, duration, order_index, notes_file, quiz_file, assignment_file)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id
-            """, (chapter_id, title, type, content, video_url, video_file, instructions, duration, order_index, notes_file, quiz_file, assignment_file))
-            item_id = cursor.fetchone()[0]
-        else:
-            cursor.execute("""
-                INSERT INTO chapter_items (chapter_id, title, type, content, video_url, video_file, instructions, duration, order_index, notes_file, quiz_file, assignment_file)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (chapter_id, title, type, content, video_url, video_file, instructions, duration, order_index, notes_file, quiz_file, assignment_file))
-            item_id = cursor.lastrowid
+        values = (chapter_id, title, type, content, video_url, video_file, instructions, duration,
+                  order_index, chapter_id, notes_file, quiz_file, assignment_file)
+        item_id = _insert_returning_id(cursor, SQL_ADD_CHAPTER_ITEM, values)
         
         conn.commit()
         return item_id
     except Exception as e:
-        print(f"Error adding chapter item: {e}")
+        logger.error("Error adding chapter item: %s", e)
         conn.rollback()
         return None
     finally:
         conn.close()
 
+def add_chapter_items_bulk(chapter_id, items):
+    """Add several items to a chapter in one transaction - returns the new ids in input order"""
+    if not items:
+        return []
+    try:
+        with db_cursor() as (conn, cursor):
+            # One statement per item on a single cursor and commit: each id comes from its own
+            # INSERT, so the list matches the input order, and items without an order_index are
+            # appended after the ones inserted before them
+            item_ids = []
+            for item in items:
+                item_type = item['type']
+                attachment = item.get('attachment_filename') or None
+                values = (chapter_id, item['title'], item_type, item.get('content', ''), item.get('video_url', ''),
+                          item.get('video_file', ''), item.get('instructions', ''), item.get('duration', ''),
+                          item.get('order_index'), chapter_id,
+                          attachment if item_type == 'lesson' else None,
+                          attachment if item_type == 'quiz' else None,
+                          attachment if item_type == 'assignment' else None)
+                item_ids.append(_insert_returning_id(cursor, SQL_ADD_CHAPTER_ITEM, values))
+            conn.commit()
+            return item_ids
+    except Exception as e:
+        logger.error("Error adding chapter items: %s", e)
+        return []
+
 # ==================== AUTHENTICATION ====================
 
-def verify_admin(email, password):
-    """Verify admin credentials"""
-    conn = get_db()
-    cursor = conn.cursor()
-    try:
-        cursor.execute("SELECT * FROM admins WHERE email = %s", (email,))
-        admin = cursor.fetchone()
-        if admin and check_password_hash(admin[2], password):
-            return {
-                'id': admin[0],
-                'email': admin[1],
-                'password': admin[2],
-                'role': admin[3] if len(admin) > 3 else 'admin'
-            }
+def _rehash_password(table, user_id, password):
+    """Store an upgraded hash after a successful login; failure leaves the old hash usable"""
+    try:
+        with db_cursor() as (conn, cursor):
+            cursor.execute(SQL_SET_PASSWORD[table], (hash_password(password), user_id))
+            conn.commit()
+    except Exception as e:
+        logger.error("Error upgrading password hash: %s", e)
+
+# Column order of each login query; the password hash is always the last column
+VERIFY_USER_KEYS = {
+    'admins': ('id', 'email', 'role'),
+    'students': ('id', 'name', 'email', 'admission_no', 'college'),
+    'lecturers': ('id', 'name', 'email'),
+}
+SQL_VERIFY_USER = {
+    table: q(f"SELECT {', '.join(keys)}, password FROM {table} WHERE email = %s"
+             + (" AND is_active" if table == 'admins' else ""))
+    for table, keys in VERIFY_USER_KEYS.items()
+}
+PREPARED_SQL.update({f'verify_{table}': sql for table, sql in SQL_VERIFY_USER.items()})
+
+@functools.lru_cache(maxsize=None)
+def _dummy_password_hash():
+    """A hash of a random secret, built on first use, for checking passwords against unknown emails"""
+    return hash_password(os.urandom(16).hex())
+
+# (table, email) -> (expires_at, stored hash, password digest) for recent successful logins.
+# Only the KDF result is remembered: every login still reads the row, so a changed password,
+# a deleted account or a deactivated admin is seen immediately, in every worker
+VERIFY_CACHE_TTL = 60
+VERIFY_CACHE_SIZE = 256
+_verify_cache = {}
+_verify_cache_lock = threading.Lock()
+# Keyed per process so the cached digests are useless outside it
+_verify_cache_key = os.urandom(32)
+
+def _password_digest(password):
+    return hmac.new(_verify_cache_key, password.encode(), hashlib.sha256).digest()
+
+def _forget_verified(table):
+    """Drop remembered password checks for a table after a password change or account removal"""
+    with _verify_cache_lock:
+        for key in [k for k in _verify_cache if k[0] == table]:
+            del _verify_cache[key]
+
+def _verify_user(table, email, password, label):
+    """Look up a login row with one SELECT and check the password after the connection is back in the pool"""
+    try:
+        with db_cursor() as (conn, cursor):
+            _execute_prepared(cursor, f'verify_{table}', (email,))
+            user = cursor.fetchone()
+    except Exception as e:
+        logger.error("Error in %s: %s", label, e)
         return None
-    except Exception as e:
-        print(f"Error in verify_admin: {e}")
+    if not user:
+        # Spend the same hashing time as a real check so response times don't reveal which emails exist
+        check_password(_dummy_password_hash(), password)
         return None
-    finally:
-        conn.close()
+    # Unpacked by position: no per-column name lookups on the login path
+    *values, stored_hash = user
+    # Callers only need the identity; the hash stays out of the result
+    result = dict(zip(VERIFY_USER_KEYS[table], values))
+    digest = _password_digest(password)
+    cached = _verify_cache.get((table, email))
+    if (cached and cached[0] > time.monotonic() and cached[1] == stored_hash
+            and hmac.compare_digest(cached[2], digest)):
+        # Same stored hash and same password as a recent success: skip the KDF
+        return result
+    matches, needs_rehash = check_password(stored_hash, password)
+    if not matches:
+        return None
+    if needs_rehash:
+        # The row now holds a new hash; the next login re-checks and caches that one
+        _rehash_password(table, values[0], password)
+        return result
+    with _verify_cache_lock:
+        if len(_verify_cache) >= VERIFY_CACHE_SIZE:
+            del _verify_cache[next(iter(_verify_cache))]
+        _verify_cache[(table, email)] = (time.monotonic() + VERIFY_CACHE_TTL, stored_hash, digest)
+    return result
+
+def verify_admin(email, password):
+    """Verify admin credentials"""
+    return _verify_user('admins', email, password, 'verify_admin')
 
 def verify_student(email, password):
     """Verify student credentials"""
-    conn = get_db()
-    cursor = conn.cursor()
-    try:
-        cursor.execute("SELECT * FROM students WHERE email = %s", (email,))
-        student = cursor.fetchone()
-        if student and check_password_hash(student[4], password):
-            return {
-                'id': student[0],
-                'name': student[1],
-                'email': student[2],
-                'admission_no': student[3],
-                'password': student[4],
-                'college': student[5] if len(student) > 5 else 'Not assigned'
-            }
-        return None
-    except Exception as e:
-        print(f"Error in verify_student: {e}")
-        return None
-    finally:
-        conn.close()
+    return _verify_user('students', email, password, 'verify_student')
 
 def verify_lecturer(email, password):
     """Verify lecturer credentials"""
-    conn = get_db()
-    cursor = conn.cursor()
-    try:
-        cursor.execute("SELECT * FROM lecturers WHERE email = %s", (email,))
-        lecturer = cursor.fetchone()
-        if lecturer and check_password_hash(lecturer[3], password):
-            return {
-                'id': lecturer[0],
-                'name': lecturer[1],
-                'email': lecturer[2],
-                'password': lecturer[3]
-            }
-        return None
-    except Exception as e:
-        print(f"Error in verify_lecturer: {e}")
-        return None
-    finally:
-        conn.close()
+    return _verify_user('lecturers', email, password, 'verify_lecturer')
+
+# Duplicate emails/admission numbers/unit codes from either backend.
+# The create_* helpers turn only these into a None result; connection and SQL errors
+# propagate so they are not reported to the user as "already exists"
+INTEGRITY_ERRORS = (sqlite3.IntegrityError, psycopg2.IntegrityError)
+
+SQL_CREATE_STUDENT = q("INSERT INTO students (name, email, admission_no, password, college) VALUES (%s, %s, %s, %s, %s)")
+SQL_CREATE_LECTURER = q("INSERT INTO lecturers (name, email, password) VALUES (%s, %s, %s)")
+SQL_ADMIN_EXISTS = q("SELECT 1 FROM admins WHERE email = %s")
+SQL_CREATE_ADMIN = q("INSERT INTO admins (email, password, role) VALUES (%s, %s, %s)")
 
 def create_student(name, email, admission_no, password, college):
-    """Create a new student account"""
-    conn = get_db()
-    cursor = conn.cursor()
-    hashed_pw = generate_password_hash(password)
-    try:
-        cursor.execute(
-            "INSERT INTO students (name, email, admission_no, password, college) VALUES (%s, %s, %s, %s, %s)",
-            (name, email, admission_no, hashed_pw, college)
-        )
-        conn.commit()
-        return True
-    except Exception as e:
-        print(f"Error creating student: {e}")
-        conn.rollback()
-        return False
-    finally:
-        conn.close()
+    """Create a new student account; returns the new id, or None if it already exists"""
+    hashed_pw = hash_password(password)
+    try:
+        with db_cursor() as (conn, cursor):
+            student_id = _insert_returning_id(cursor, SQL_CREATE_STUDENT, (name, email, admission_no, hashed_pw, college))
+            conn.commit()
+            return student_id
+    except INTEGRITY_ERRORS:
+        return None
 
 def create_lecturer(name, email, password):
-    """Create a new lecturer account"""
-    conn = get_db()
-    cursor = conn.cursor()
-    hashed_pw = generate_password_hash(password)
-    try:
-        cursor.execute(
-            "INSERT INTO lecturers (name, email, password) VALUES (%s, %s, %s)",
-            (name, email, hashed_pw)
-        )
-        conn.commit()
-        return True
-    except Exception as e:
-        print(f"Error creating lecturer: {e}")
-        conn.rollback()
-        return False
-    finally:
-        conn.close()
+    """Create a new lecturer account; returns the new id, or None if it already exists"""
+    hashed_pw = hash_password(password)
+    try:
+        with db_cursor() as (conn, cursor):
+            lecturer_id = _insert_returning_id(cursor, SQL_CREATE_LECTURER, (name, email, hashed_pw))
+            conn.commit()
+        invalidate_shared(get_all_lecturers)
+        return lecturer_id
+    except INTEGRITY_ERRORS:
+        return None
 
 def create_super_admin(email, password):
-    """Create super admin account"""
-    conn = get_db()
-    cursor = conn.cursor()
-    hashed_pw = generate_password_hash(password)
-    try:
-        cursor.execute(
-            "INSERT INTO admins (email, password, role) VALUES (%s, %s, %s)",
-            (email, hashed_pw, 'super_admin')
-        )
-        conn.commit()
-        return True
-    except Exception as e:
-        print(f"Error creating admin: {e}")
-        conn.rollback()
-        return False
-    finally:
-        conn.close()
+    """Create super admin account; returns the new id, or None if it already exists"""
+    try:
+        with db_cursor() as (conn, cursor):
+            # Only pay for the password hash when we actually insert
+            cursor.execute(SQL_ADMIN_EXISTS, (email,))
+            if cursor.fetchone():
+                return None
+            admin_id = _insert_returning_id(cursor, SQL_CREATE_ADMIN, (email, hash_password(password), 'super_admin'))
+            conn.commit()
+            return admin_id
+    except INTEGRITY_ERRORS:
+        return None
 
+# The by-id user lookups are only cached per request: get_admin_by_id authorizes every admin
+# request, and a profile edit must show up at once in every worker
+@_request_cached
 def get_admin_by_id(admin_id):
     """Get admin by ID"""
-    conn = get_db()
-    cursor = conn.cursor()
     try:
-        cursor.execute("SELECT * FROM admins WHERE id = %s", (admin_id,))
-        admin = cursor.fetchone()
-        if admin:
-            return {
-                'id': admin[0],
-                'email': admin[1],
-                'password': admin[2],
-                'role': admin[3] if len(admin) > 3 else 'admin'
-            }
-        return None
+        with db_cursor() as (conn, cursor):
+            _execute_prepared(cursor, 'get_admin_by_id', (admin_id,))
+            admin = cursor.fetchone()
+            return dict(admin) if admin else None
     except Exception as e:
-        print(f"Error getting admin: {e}")
+        logger.error("Error getting admin: %s", e)
         return None
-    finally:
-        conn.close()
 
+@_request_cached
 def get_student_by_id(student_id):
     """Get student by ID"""
-    conn = get_db()
-    cursor = conn.cursor()
     try:
-        cursor.execute("SELECT * FROM students WHERE id = %s", (student_id,))
-        student = cursor.fetchone()
-        if student:
-            return {
-                'id': student[0],
-                'name': student[1],
-                'email': student[2],
-                'admission_no': student[3],
-                'password': student[4],
-                'college': student[5] if len(student) > 5 else 'Not assigned'
-            }
-        return None
+        with db_cursor() as (conn, cursor):
+            _execute_prepared(cursor, 'get_student_by_id', (student_id,))
+            student = cursor.fetchone()
+            return dict(student) if student else None
     except Exception as e:
-        print(f"Error getting student: {e}")
+        logger.error("Error getting student: %s", e)
         return None
-    finally:
-        conn.close()
 
+@_request_cached
 def get_lecturer_by_id(lecturer_id):
     """Get lecturer by ID"""
-    conn = get_db()
-    cursor = conn.cursor()
     try:
-        cursor.execute("SELECT * FROM lecturers WHERE id = %s", (lecturer_id,))
-        lecturer = cursor.fetchone()
-        if lecturer:
-            return {
-                'id': lecturer[0],
-                'name': lecturer[1],
-                'email': lecturer[2],
-                'password': lecturer[3]
-            }
-        return None
+        with db_cursor() as (conn, cursor):
+            _execute_prepared(cursor, 'get_lecturer_by_id', (lecturer_id,))
+            lecturer = cursor.fetchone()
+            return dict(lecturer) if lecturer else None
     except Exception as e:
-        print(f"Error getting lecturer: {e}")
+        logger.error("Error getting lecturer: %s", e)
         return None
-    finally:
-        conn.close()
 
 def get_all_students():
     """Get all students"""
@@ -1031,690 +1540,564 @@ def get_all_students():
     cursor = conn.cursor()
     try:
         cursor.execute("SELECT id, name, email, admission_no, college, created_at FROM students ORDER BY created_at DESC")
-        students = []
-        for row in cursor.fetchall():
-            students.append({
-                'id': row[0],
-                'name': row[1],
-                'email': row[2],
-                'admission_no': row[3],
-                'college': row[4],
-                'created_at': row[5]
-            })
-        return students
+        return [dict(row) for row in cursor.fetchall()]
     except Exception as e:
-        print(f"Error getting students: {e}")
+        logger.error("Error getting students: %s", e)
         return []
     finally:
         conn.close()
 
+@_shared_cached
 def get_all_lecturers():
     """Get all lecturers"""
     conn = get_db()
     cursor = conn.cursor()
     try:
-        cursor.execute("SELECT * FROM lecturers ORDER BY created_at DESC")
-        lecturers = []
-        for row in cursor.fetchall():
-            lecturers.append({
-                'id': row[0],
-                'name': row[1],
-                'email': row[2],
-                'created_at': row[4] if len(row) > 4 else None
-            })
-        return lecturers
-    except Exception as e:
-        print(f"Error getting lecturers: {e}")
-        return []
+        cursor.execute("SELECT id, name, email, created_at FROM lecturers ORDER BY created_at DESC")
+        return [dict(row) for row in cursor.fetchall()]
     finally:
         conn.close()
 
+@_shared_cached
 def get_all_units_with_details():
     """Get all units with proper lecturer names"""
-    conn = get_db()
-    cursor = conn.cursor()
-    try:
+    with db_cursor() as (conn, cursor):
         cursor.execute('''
             SELECT 
                 u.id, u.code, u.title, u.lecturer_id,
-                l.name as lecturer_name,
-                (SELECT COUNT(*) FROM student_units su WHERE su.unit_id = u.id) as student_count
+                COALESCE(l.name, 'Not assigned') as lecturer_name,
+                COALESCE(s.c, 0) as student_count
             FROM units u 
             LEFT JOIN lecturers l ON u.lecturer_id = l.id
+            LEFT JOIN (
+                SELECT unit_id, COUNT(*) AS c FROM student_units GROUP BY unit_id
+            ) s ON s.unit_id = u.id
             ORDER BY u.code
         ''')
-        units = []
-        rows = cursor.fetchall()
-        for row in rows:
-            if hasattr(row, 'keys'):
-                unit_data = dict(row)
-                lecturer_name = unit_data.get('lecturer_name')
-                units.append({
-                    'id': unit_data['id'],
-                    'code': unit_data['code'],
-                    'title': unit_data['title'],
-                    'lecturer_id': unit_data['lecturer_id'],
-                    'lecturer_name': lecturer_name if lecturer_name else 'Not assigned',
-                    'student_count': unit_data.get('student_count', 0)
-                })
-            else:
-                lecturer_name = row[4] if len(row) > 4 and row[4] else None
-                units.append({
-                    'id': row[0],
-                    'code': row[1],
-                    'title': row[2],
-                    'lecturer_id': row[3],
-                    'lecturer_name': lecturer_name if lecturer_name else 'Not assigned',
-                    'student_count': row[5] if len(row) > 5 else 0
-                })
-        return units
-    except Exception as e:
-        print(f"Error getting units: {e}")
-        return []
-    finally:
-        conn.close()
+        return [dict(row) for row in cursor.fetchall()]
+
+SQL_UNITS_BY_LECTURER = q("SELECT id, code, title, lecturer_id FROM units WHERE lecturer_id = %s")
 
 def get_units_by_lecturer(lecturer_id):
     """Get units by lecturer"""
-    conn = get_db()
-    cursor = conn.cursor()
     try:
-        cursor.execute("SELECT * FROM units WHERE lecturer_id = %s", (lecturer_id,))
-        units = []
-        for row in cursor.fetchall():
-            units.append({
-                'id': row[0],
-                'code': row[1],
-                'title': row[2],
-                'lecturer_id': row[3]
-            })
-        return units
+        with db_cursor() as (conn, cursor):
+            cursor.execute(SQL_UNITS_BY_LECTURER, (lecturer_id,))
+            return [dict(row) for row in cursor.fetchall()]
     except Exception as e:
-        print(f"Error getting lecturer units: {e}")
+        logger.error("Error getting lecturer units: %s", e)
         return []
-    finally:
-        conn.close()
 
+@_shared_cached
 def get_all_units():
     """Get all units for students to browse"""
     conn = get_db()
     cursor = conn.cursor()
     try:
         cursor.execute("SELECT id, code, title, lecturer_id FROM units ORDER BY code")
-        units = []
-        for row in cursor.fetchall():
-            if hasattr(row, 'keys'):
-                unit_data = dict(row)
-                units.append({
-                    'id': unit_data['id'],
-                    'code': unit_data['code'],
-                    'title': unit_data['title'],
-                    'lecturer_id': unit_data['lecturer_id']
-                })
-            else:
-                units.append({
-                    'id': row[0],
-                    'code': row[1],
-                    'title': row[2],
-                    'lecturer_id': row[3]
-                })
-        return units
-    except Exception as e:
-        print(f"Error getting all units: {e}")
-        return []
+        return [dict(row) for row in cursor.fetchall()]
     finally:
         conn.close()
 
+SQL_CREATE_UNIT = q("INSERT INTO units (code, title, lecturer_id) VALUES (%s, %s, %s)")
+
 def create_unit(code, title, lecturer_id):
-    """Create a new unit"""
-    conn = get_db()
-    cursor = conn.cursor()
+    """Create a new unit and return its id"""
     try:
-        cursor.execute(
-            "INSERT INTO units (code, title, lecturer_id) VALUES (%s, %s, %s)",
-            (code, title, lecturer_id)
-        )
-        conn.commit()
-        return True
-    except Exception as e:
-        print(f"Error creating unit: {e}")
-        conn.rollback()
-        return False
-    finally:
-        conn.close()
+        with db_cursor() as (conn, cursor):
+            unit_id = _insert_returning_id(
+                cursor,
+                SQL_CREATE_UNIT,
+                (code, title, lecturer_id)
+            )
+            conn.commit()
+            invalidate_shared(get_all_units, get_all_units_with_details)
+            return unit_id
+    except INTEGRITY_ERRORS:
+        return None
 
 def get_unit_by_id(unit_id):
     """Get unit by ID"""
-    conn = get_db()
-    cursor = conn.cursor()
     try:
-        cursor.execute("SELECT * FROM units WHERE id = %s", (unit_id,))
-        unit = cursor.fetchone()
-        if unit:
-            return {
-                'id': unit[0],
-                'code': unit[1],
-                'title': unit[2],
-                'lecturer_id': unit[3]
-            }
-        return None
+        with db_cursor() as (conn, cursor):
+            _execute_prepared(cursor, 'get_unit_by_id', (unit_id,))
+            unit = cursor.fetchone()
+            return dict(unit) if unit else None
     except Exception as e:
-        print(f"Error getting unit: {e}")
+        logger.error("Error getting unit: %s", e)
         return None
-    finally:
-        conn.close()
+
+SQL_REGISTER_STUDENT_UNIT = q("INSERT INTO student_units (student_id, unit_id) SELECT %s, id FROM units WHERE code = %s")
+if HAS_RETURNING:
+    PREPARED_SQL['register_student_unit'] = SQL_REGISTER_STUDENT_UNIT + " RETURNING unit_id"
 
 def register_student_unit(student_id, unit_code):
-    """Register student for a unit"""
-    conn = get_db()
-    cursor = conn.cursor()
-    try:
-        cursor.execute("SELECT id FROM units WHERE code = %s", (unit_code,))
-        unit = cursor.fetchone()
-        if not unit:
-            return False
-        cursor.execute(
-            "INSERT INTO student_units (student_id, unit_id) VALUES (%s, %s)",
-            (student_id, unit[0])
-        )
-        conn.commit()
-        return True
-    except Exception as e:
-        print(f"Error registering student unit: {e}")
-        conn.rollback()
-        return False
-    finally:
-        conn.close()
+    """Register student for a unit; returns the unit id"""
+    try:
+        with db_cursor() as (conn, cursor):
+            # Resolve the code and insert in one statement; no row means the unit doesn't exist
+            if HAS_RETURNING:
+                _execute_prepared(cursor, 'register_student_unit', (student_id, unit_code))
+                row = cursor.fetchone()
+                unit_id = row['unit_id'] if row else None
+            else:
+                cursor.execute(SQL_REGISTER_STUDENT_UNIT, (student_id, unit_code))
+                unit_id = None
+                if cursor.rowcount:
+                    cursor.execute("SELECT unit_id FROM student_units WHERE id = ?", (cursor.lastrowid,))
+                    unit_id = cursor.fetchone()['unit_id']
+            if unit_id is None:
+                return None
+            conn.commit()
+            invalidate_shared(get_all_units_with_details)
+            return unit_id
+    except INTEGRITY_ERRORS:
+        # Already registered for this unit
+        return None
+
+def bulk_register_student_units(student_id, unit_codes):
+    """Register student for several units at once; returns how many were added"""
+    unit_codes = list(dict.fromkeys(code for code in unit_codes if code))
+    if not unit_codes:
+        return 0
+    code_filter, code_params = _in_filter("u.code", unit_codes)
+    try:
+        with db_cursor() as (conn, cursor):
+            # Units the student already has are skipped instead of failing the whole batch
+            cursor.execute(f"""
+                INSERT INTO student_units (student_id, unit_id)
+                SELECT {PARAM}, u.id FROM units u
+                WHERE {code_filter}
+                  AND NOT EXISTS (SELECT 1 FROM student_units su
+                                  WHERE su.student_id = {PARAM} AND su.unit_id = u.id)
+            """, (student_id,) + code_params + (student_id,))
+            added = cursor.rowcount
+            conn.commit()
+            invalidate_shared(get_all_units_with_details)
+            return added
+    except Exception as e:
+        logger.error("Error bulk registering student units: %s", e)
+        return 0
+
+SQL_STUDENT_UNITS = q('''
+    SELECT u.id, u.code, u.title, u.lecturer_id, l.name as lecturer, u.id as unit_id
+    FROM units u 
+    JOIN student_units su ON u.id = su.unit_id 
+    LEFT JOIN lecturers l ON u.lecturer_id = l.id 
+    WHERE su.student_id = %s
+''')
+SQL_STUDENT_RESULTS = q('''
+    SELECT u.code, u.title, r.score, r.remarks 
+    FROM results r 
+    JOIN units u ON r.unit_id = u.id 
+    WHERE r.student_id = %s
+''')
 
 def get_student_units(student_id):
     """Get units registered by student"""
-    conn = get_db()
-    cursor = conn.cursor()
     try:
-        cursor.execute('''
-            SELECT u.*, l.name as lecturer 
-            FROM units u 
-            JOIN student_units su ON u.id = su.unit_id 
-            LEFT JOIN lecturers l ON u.lecturer_id = l.id 
-            WHERE su.student_id = %s
-        ''', (student_id,))
-        units = []
-        for row in cursor.fetchall():
-            units.append({
-                'id': row[0],
-                'code': row[1],
-                'title': row[2],
-                'lecturer_id': row[3],
-                'lecturer': row[4] if len(row) > 4 else 'Unknown',
-                'unit_id': row[0]
-            })
-        return units
+        with db_cursor() as (conn, cursor):
+            cursor.execute(SQL_STUDENT_UNITS, (student_id,))
+            return [dict(row) for row in cursor.fetchall()]
     except Exception as e:
-        print(f"Error getting student units: {e}")
+        logger.error("Error getting student units: %s", e)
         return []
-    finally:
-        conn.close()
 
 def get_student_results(student_id):
     """Get results for a student"""
-    conn = get_db()
-    cursor = conn.cursor()
     try:
-        cursor.execute('''
-            SELECT u.code, u.title, r.score, r.remarks 
-            FROM results r 
-            JOIN units u ON r.unit_id = u.id 
-            WHERE r.student_id = %s
-        ''', (student_id,))
-        results = []
-        for row in cursor.fetchall():
-            results.append({
-                'code': row[0],
-                'title': row[1],
-                'score': row[2],
-                'remarks': row[3]
-            })
-        return results
+        with db_cursor() as (conn, cursor):
+            cursor.execute(SQL_STUDENT_RESULTS, (student_id,))
+            return [dict(row) for row in cursor.fetchall()]
     except Exception as e:
-        print(f"Error getting student results: {e}")
+        logger.error("Error getting student results: %s", e)
         return []
-    finally:
-        conn.close()
+
+SQL_ALL_RESULTS = '''
+    SELECT 
+        r.id,
+        s.name as student_name,
+        s.admission_no,
+        u.code as unit_code,
+        u.title as unit_title,
+        r.score,
+        r.remarks,
+        l.name as lecturer_name,
+        r.recorded_at as created_at
+    FROM results r
+    JOIN students s ON r.student_id = s.id
+    JOIN units u ON r.unit_id = u.id
+    LEFT JOIN lecturers l ON u.lecturer_id = l.id
+    ORDER BY r.recorded_at DESC
+'''
 
 def get_all_results():
     """Get all student results for admin view with lecturer information"""
-    conn = get_db()
-    cursor = conn.cursor()
     try:
-        cursor.execute('''
-            SELECT 
-                r.id,
-                s.name as student_name,
-                s.admission_no,
-                u.code as unit_code,
-                u.title as unit_title,
-                r.score,
-                r.remarks,
-                l.name as lecturer_name,
-                r.created_at
-            FROM results r
-            JOIN students s ON r.student_id = s.id
-            JOIN units u ON r.unit_id = u.id
-            LEFT JOIN lecturers l ON u.lecturer_id = l.id
-            ORDER BY r.created_at DESC
-        ''')
-        results = []
-        for row in cursor.fetchall():
-            if hasattr(row, 'keys'):
-                result_data = dict(row)
-                results.append({
-                    'id': result_data['id'],
-                    'student_name': result_data['student_name'],
-                    'admission_no': result_data['admission_no'],
-                    'unit_code': result_data['unit_code'],
-                    'unit_title': result_data['unit_title'],
-                    'score': result_data['score'],
-                    'remarks': result_data.get('remarks', ''),
-                    'lecturer_name': result_data.get('lecturer_name', ''),
-                    'created_at': result_data['created_at']
-                })
-            else:
-                results.append({
-                    'id': row[0],
-                    'student_name': row[1],
-                    'admission_no': row[2],
-                    'unit_code': row[3],
-                    'unit_title': row[4],
-                    'score': row[5],
-                    'remarks': row[6] if len(row) > 6 else '',
-                    'lecturer_name': row[7] if len(row) > 7 else '',
-                    'created_at': row[8] if len(row) > 8 else None
-                })
-        return results
+        with db_cursor() as (conn, cursor):
+            cursor.execute(SQL_ALL_RESULTS)
+            return [dict(row) for row in cursor.fetchall()]
     except Exception as e:
-        print(f"Error getting all results: {e}")
+        logger.error("Error getting all results: %s", e)
         return []
-    finally:
-        conn.close()
+
+def iter_all_results():
+    """Yield every result row for exports without loading the whole table"""
+    return _iter_rows(SQL_ALL_RESULTS, (), 'all_results_cursor', 'iter_all_results')
+
+SQL_GET_UNIT_STUDENTS = q("""
+    SELECT s.id, s.name, s.email, s.admission_no,
+           COALESCE(s.college, 'Not assigned') AS college, r.score, r.remarks
+    FROM student_units su
+    JOIN students s ON s.id = su.student_id
+    LEFT JOIN results r ON r.student_id = su.student_id AND r.unit_id = su.unit_id
+    WHERE su.unit_id = %s
+    ORDER BY s.name
+""")
 
 def get_unit_students(unit_id):
     """Get students registered for a unit"""
-    conn = get_db()
-    cursor = conn.cursor()
     try:
-        cursor.execute('''
-            SELECT s.*, r.score, r.remarks 
-            FROM students s 
-            JOIN student_units su ON s.id = su.student_id 
-            LEFT JOIN results r ON s.id = r.student_id AND r.unit_id = %s
-            WHERE su.unit_id = %s
-        ''', (unit_id, unit_id))
-        students = []
-        for row in cursor.fetchall():
-            students.append({
-                'id': row[0],
-                'name': row[1],
-                'email': row[2],
-                'admission_no': row[3],
-                'college': row[5] if len(row) > 5 else 'Not assigned',
-                'score': row[6] if len(row) > 6 else None,
-                'remarks': row[7] if len(row) > 7 else None
-            })
-        return students
+        with db_cursor() as (conn, cursor):
+            cursor.execute(SQL_GET_UNIT_STUDENTS, (unit_id,))
+            return [dict(row) for row in cursor.fetchall()]
     except Exception as e:
-        print(f"Error getting unit students: {e}")
+        logger.error("Error getting unit students: %s", e)
         return []
-    finally:
-        conn.close()
 
 # -------- Google OAuth + 2FA helpers --------
 
+@_request_cached
 def get_student_by_google_id(google_id):
-    conn = get_db()
-    cursor = conn.cursor()
     try:
-        cursor.execute("SELECT * FROM students WHERE google_id = %s", (google_id,))
-        student = cursor.fetchone()
-        if student:
-            return {
-                'id': student[0],
-                'name': student[1],
-                'email': student[2],
-                'admission_no': student[3],
-                'password': student[4],
-                'college': student[5] if len(student) > 5 else 'Not assigned',
-                'created_at': student[6] if len(student) > 6 else None,
-                'google_id': student[7] if len(student) > 7 else None,
-                'totp_secret': student[8] if len(student) > 8 else None
-            }
-        return None
+        with db_cursor() as (conn, cursor):
+            _execute_prepared(cursor, 'get_student_by_google_id', (google_id,))
+            student = cursor.fetchone()
+            return dict(student) if student else None
     except Exception as e:
-        print(f"Error getting student by Google ID: {e}")
+        logger.error("Error getting student by Google ID: %s", e)
         return None
-    finally:
-        conn.close()
 
+@_request_cached
 def get_student_by_email(email):
-    conn = get_db()
-    cursor = conn.cursor()
     try:
-        cursor.execute("SELECT * FROM students WHERE email = %s", (email,))
-        student = cursor.fetchone()
-        if student:
-            return {
-                'id': student[0],
-                'name': student[1],
-                'email': student[2],
-                'admission_no': student[3],
-                'password': student[4],
-                'college': student[5] if len(student) > 5 else 'Not assigned',
-                'created_at': student[6] if len(student) > 6 else None,
-                'google_id': student[7] if len(student) > 7 else None,
-                'totp_secret': student[8] if len(student) > 8 else None
-            }
-        return None
+        with db_cursor() as (conn, cursor):
+            _execute_prepared(cursor, 'get_student_by_email', (email,))
+            student = cursor.fetchone()
+            return dict(student) if student else None
     except Exception as e:
-        print(f"Error getting student by email: {e}")
+        logger.error("Error getting student by email: %s", e)
         return None
-    finally:
-        conn.close()
+
+SQL_SET_GOOGLE_ID = q("UPDATE students SET google_id = %s WHERE id = %s")
 
 def update_student_google_id(student_id, google_id):
-    conn = get_db()
-    cursor = conn.cursor()
     try:
-        cursor.execute(
-            "UPDATE students SET google_id = %s WHERE id = %s",
-            (google_id, student_id)
-        )
-        conn.commit()
+        with db_cursor() as (conn, cursor):
+            cursor.execute(SQL_SET_GOOGLE_ID, (google_id, student_id))
+            conn.commit()
+        invalidate(get_student_by_google_id)
+        invalidate(get_student_by_email)
         return True
     except Exception as e:
-        print(f"Error updating Google ID: {e}")
-        conn.rollback()
+        logger.error("Error updating Google ID: %s", e)
         return False
-    finally:
-        conn.close()
 
 def update_totp_secret(user_type, user_id, secret):
-    conn = get_db()
-    cursor = conn.cursor()
+    if user_type not in USER_TABLES:
+        return False
     try:
-        if user_type == 'student':
-            cursor.execute("UPDATE students SET totp_secret = %s WHERE id = %s", (secret, user_id))
-        elif user_type == 'lecturer':
-            cursor.execute("UPDATE lecturers SET totp_secret = %s WHERE id = %s", (secret, user_id))
-        elif user_type == 'admin':
-            cursor.execute("UPDATE admins SET totp_secret = %s WHERE id = %s", (secret, user_id))
-        conn.commit()
-        return True
+        with db_cursor() as (conn, cursor):
+            cursor.execute(SQL_SET_TOTP_SECRET[USER_TABLES[user_type]], (secret, user_id))
+            conn.commit()
     except Exception as e:
-        print(f"Error updating TOTP secret: {e}")
-        conn.rollback()
+        logger.error("Error updating TOTP secret: %s", e)
         return False
-    finally:
-        conn.close()
+    invalidate(get_totp_secret, user_type, user_id)
+    return True
 
+@_request_cached
 def get_totp_secret(user_type, user_id):
-    conn = get_db()
-    cursor = conn.cursor()
+    if user_type not in USER_TABLES:
+        return None
     try:
-        if user_type == 'student':
-            cursor.execute("SELECT totp_secret FROM students WHERE id = %s", (user_id,))
-        elif user_type == 'lecturer':
-            cursor.execute("SELECT totp_secret FROM lecturers WHERE id = %s", (user_id,))
-        elif user_type == 'admin':
-            cursor.execute("SELECT totp_secret FROM admins WHERE id = %s", (user_id,))
-        result = cursor.fetchone()
-        return result[0] if result and result[0] else None
+        with db_cursor() as (conn, cursor):
+            _execute_prepared(cursor, f'get_{user_type}_totp', (user_id,))
+            result = cursor.fetchone()
+            return result['totp_secret'] if result and result['totp_secret'] else None
     except Exception as e:
-        print(f"Error getting TOTP secret: {e}")
+        logger.error("Error getting TOTP secret: %s", e)
         return None
-    finally:
-        conn.close()
+
+SQL_UPSERT_RESULT_CONFLICT = """
+    ON CONFLICT (student_id, unit_id)
+    DO UPDATE SET score = excluded.score, remarks = excluded.remarks
+"""
+RESULTS_BULK_PAGE_SIZE = 1000
 
 def update_student_result(student_id, unit_id, score, remarks):
-    conn = get_db()
-    cursor = conn.cursor()
+    return update_student_results_bulk([(student_id, unit_id, score, remarks)])
+
+def update_student_results_bulk(rows):
+    """Upsert (student_id, unit_id, score, remarks) rows in multi-row statements with one commit"""
+    # ON CONFLICT cannot touch the same row twice in one statement, so keep the last value per pair
+    latest = {(student_id, unit_id): (score, remarks) for student_id, unit_id, score, remarks in rows}
+    if not latest:
+        return True
+    rows = [(student_id, unit_id) + value for (student_id, unit_id), value in latest.items()]
     try:
-        cursor.execute('''
-            INSERT INTO results (student_id, unit_id, score, remarks) 
-            VALUES (%s, %s, %s, %s)
-            ON CONFLICT (student_id, unit_id) 
-            DO UPDATE SET score = %s, remarks = %s
-        ''', (student_id, unit_id, score, remarks, score, remarks))
-        conn.commit()
+        with db_cursor() as (conn, cursor):
+            _insert_rows(cursor, 'results', ('student_id', 'unit_id', 'score', 'remarks'), rows,
+                         suffix=SQL_UPSERT_RESULT_CONFLICT, page_size=RESULTS_BULK_PAGE_SIZE)
+            conn.commit()
         return True
     except Exception as e:
-        print(f"Error updating result: {e}")
-        conn.rollback()
+        logger.error("Error updating result: %s", e)
         return False
-    finally:
-        conn.close()
+
+SQL_ADD_RESOURCE = q("INSERT INTO resources (unit_id, title, filename) VALUES (%s, %s, %s)")
 
 def add_resource(unit_id, title, filename):
-    conn = get_db()
-    cursor = conn.cursor()
     try:
-        cursor.execute(
-            "INSERT INTO resources (unit_id, title, filename) VALUES (%s, %s, %s)",
-            (unit_id, title, filename)
-        )
-        conn.commit()
-        return True
+        with db_cursor() as (conn, cursor):
+            resource_id = _insert_returning_id(
+                cursor,
+                SQL_ADD_RESOURCE,
+                (unit_id, title, filename)
+            )
+            conn.commit()
+            return resource_id
     except Exception as e:
-        print(f"Error adding resource: {e}")
-        conn.rollback()
-        return False
-    finally:
-        conn.close()
+        logger.error("Error adding resource: %s", e)
+        return None
 
 def get_unit_resources(unit_id):
-    conn = get_db()
-    cursor = conn.cursor()
-    try:
-        cursor.execute("SELECT * FROM resources WHERE unit_id = %s ORDER BY uploaded_at DESC", (unit_id,))
-        resources = []
-        for row in cursor.fetchall():
-            resources.append({
-                'id': row[0],
-                'unit_id': row[1],
-                'title': row[2],
-                'filename': row[3],
-                'uploaded_at': row[4] if len(row) > 4 else None
-            })
-        return resources
-    except Exception as e:
-        print(f"Error getting resources: {e}")
-        return []
-    finally:
-        conn.close()
+    return get_resources_for_units([unit_id]).get(unit_id, [])
+
+SQL_UPCOMING_ACTIVITIES = q('''
+    SELECT a.id, a.unit_id, a.title, a.description, a.due_date, u.code as unit_code
+    FROM activities a 
+    JOIN units u ON a.unit_id = u.id 
+    JOIN student_units su ON u.id = su.unit_id 
+    WHERE su.student_id = %s AND a.due_date >= CURRENT_DATE
+    ORDER BY a.due_date
+    LIMIT 10
+''')
 
 def get_upcoming_activities(student_id):
-    conn = get_db()
-    cursor = conn.cursor()
     try:
-        cursor.execute('''
-            SELECT a.*, u.code as unit_code 
-            FROM activities a 
-            JOIN units u ON a.unit_id = u.id 
-            JOIN student_units su ON u.id = su.unit_id 
-            WHERE su.student_id = %s AND a.due_date >= CURRENT_DATE
-            ORDER BY a.due_date
-            LIMIT 10
-        ''', (student_id,))
-        activities = []
-        for row in cursor.fetchall():
-            activities.append({
-                'id': row[0],
-                'unit_id': row[1],
-                'title': row[2],
-                'description': row[3],
-                'due_date': row[4],
-                'unit_code': row[6] if len(row) > 6 else 'Unknown'
-            })
-        return activities
+        with db_cursor() as (conn, cursor):
+            cursor.execute(SQL_UPCOMING_ACTIVITIES, (student_id,))
+            return [dict(row) for row in cursor.fetchall()]
     except Exception as e:
-        print(f"Error getting activities: {e}")
+        logger.error("Error getting activities: %s", e)
         return []
-    finally:
-        conn.close()
 
 def verify_current_password(user_type, user_id, current_password):
-    if user_type == 'student':
-        student = get_student_by_id(user_id)
-        if student and check_password_hash(student['password'], current_password):
-            return True
-    elif user_type == 'lecturer':
-        lecturer = get_lecturer_by_id(user_id)
-        if lecturer and check_password_hash(lecturer['password'], current_password):
-            return True
-    elif user_type == 'admin':
-        admin = get_admin_by_id(user_id)
-        if admin and check_password_hash(admin['password'], current_password):
-            return True
-    return False
-
-def update_student_password(student_id, new_password):
-    conn = get_db()
-    cursor = conn.cursor()
-    hashed_pw = generate_password_hash(new_password)
+    if user_type not in USER_TABLES:
+        return False
     try:
-        cursor.execute(
-            "UPDATE students SET password = %s WHERE id = %s",
-            (hashed_pw, student_id)
-        )
-        conn.commit()
-        return True
+        with db_cursor() as (conn, cursor):
+            cursor.execute(SQL_GET_PASSWORD[USER_TABLES[user_type]], (user_id,))
+            row = cursor.fetchone()
     except Exception as e:
-        print(f"Error updating student password: {e}")
-        conn.rollback()
+        logger.error("Error verifying current password: %s", e)
         return False
-    finally:
-        conn.close()
+    # The connection is already back in the pool while the hash is checked
+    return bool(row) and check_password(row['password'], current_password)[0]
 
-def update_lecturer_password(lecturer_id, new_password):
-    conn = get_db()
-    cursor = conn.cursor()
-    hashed_pw = generate_password_hash(new_password)
+def update_password(user_type, user_id, new_password):
+    """Set a new password for a student, lecturer or admin"""
+    if user_type not in USER_TABLES:
+        return False
+    # Hash before checking out a connection so the KDF doesn't hold one
+    hashed_pw = hash_password(new_password)
     try:
-        cursor.execute(
-            "UPDATE lecturers SET password = %s WHERE id = %s",
-            (hashed_pw, lecturer_id)
-        )
-        conn.commit()
-        return True
+        with db_cursor() as (conn, cursor):
+            cursor.execute(SQL_SET_PASSWORD[USER_TABLES[user_type]], (hashed_pw, user_id))
+            conn.commit()
     except Exception as e:
-        print(f"Error updating lecturer password: {e}")
-        conn.rollback()
+        logger.error("Error updating %s password: %s", user_type, e)
         return False
-    finally:
-        conn.close()
+    _forget_verified(USER_TABLES[user_type])
+    invalidate_user(user_type, user_id)
+    return True
 
-def update_admin_password(admin_id, new_password):
-    conn = get_db()
-    cursor = conn.cursor()
-    hashed_pw = generate_password_hash(new_password)
-    try:
-        cursor.execute(
-            "UPDATE admins SET password = %s WHERE id = %s",
-            (hashed_pw, admin_id)
-        )
+def update_profile(user_type, user_id, name, email):
+    """Change a user's name and email (just the email for admins); errors propagate to the caller"""
+    table = USER_TABLES[user_type]
+    params = (email, user_id) if table == 'admins' else (name, email, user_id)
+    with db_cursor() as (conn, cursor):
+        cursor.execute(SQL_UPDATE_PROFILE[table], params)
         conn.commit()
-        return True
+    # Login caches are keyed on the old email
+    _forget_verified(table)
+    invalidate_user(user_type, user_id)
+    if user_type == 'lecturer':
+        invalidate_shared(get_all_lecturers, get_all_units_with_details)
+
+def invalidate_user(user_type, user_id):
+    """Drop cached lookups of one student, lecturer or admin after its row changes"""
+    if user_type == 'student':
+        by_id = get_student_by_id
+        invalidate(get_student_by_email)
+        invalidate(get_student_by_google_id)
+    elif user_type == 'lecturer':
+        by_id = get_lecturer_by_id
+    else:
+        by_id = get_admin_by_id
+    invalidate(by_id, user_id)
+
+ACTIVITY_QUEUE_SIZE = 10000
+ACTIVITY_BATCH_SIZE = 500
+ACTIVITY_LINGER = 0.25  # seconds the writer waits for a batch to fill after its first row
+ACTIVITY_EXIT_TIMEOUT = 10  # seconds shutdown waits for the writer to commit what it holds
+_activity_queue = queue.Queue(maxsize=ACTIVITY_QUEUE_SIZE)
+# Queued at exit: the writer commits its current batch and the rest of the queue, then stops
+_ACTIVITY_STOP = object()
+_activity_writer = None
+_activity_writer_lock = threading.Lock()
+
+def _insert_admin_activity(rows):
+    """Write queued (admin_id, action, details, ip_address) rows in one statement"""
+    with db_cursor() as (conn, cursor):
+        _insert_rows(cursor, 'admin_activity_log', ('admin_id', 'action', 'details', 'ip_address'), rows)
+        conn.commit()
+
+def _drain_activity_queue(block=True):
+    """Take up to ACTIVITY_BATCH_SIZE queued log rows, lingering briefly for more when blocking"""
+    rows = [_activity_queue.get()] if block else []
+    deadline = time.monotonic() + ACTIVITY_LINGER
+    while len(rows) < ACTIVITY_BATCH_SIZE and _ACTIVITY_STOP not in rows:
+        try:
+            if block:
+                rows.append(_activity_queue.get(timeout=max(0, deadline - time.monotonic())))
+            else:
+                rows.append(_activity_queue.get_nowait())
+        except queue.Empty:
+            break
+    return rows
+
+def _write_activity_rows(rows):
+    """Insert a batch of log rows; if the batch fails, retry row by row so one bad row loses only itself"""
+    if not rows:
+        return
+    try:
+        _insert_admin_activity(rows)
+        return
     except Exception as e:
-        print(f"Error updating admin password: {e}")
-        conn.rollback()
-        return False
-    finally:
-        conn.close()
+        logger.error("Error logging activity batch of %s rows, retrying one by one: %s", len(rows), e)
+    for row in rows:
+        try:
+            _insert_admin_activity([row])
+        except Exception as e:
+            # Last resort: the audit row survives in the process log
+            logger.error("Dropped activity log row %r: %s", row, e)
+
+def _flush_activity_queue():
+    """Write everything still queued, without waiting for more"""
+    while True:
+        rows = [row for row in _drain_activity_queue(block=False) if row is not _ACTIVITY_STOP]
+        if not rows:
+            return
+        _write_activity_rows(rows)
+
+def _write_activity_log():
+    """Background writer: batch whatever has queued up since the last insert"""
+    while True:
+        rows = _drain_activity_queue()
+        stopping = _ACTIVITY_STOP in rows
+        _write_activity_rows([row for row in rows if row is not _ACTIVITY_STOP])
+        if stopping:
+            _flush_activity_queue()
+            return
+
+@atexit.register
+def _flush_activity_log():
+    """At exit, let the writer commit its in-flight batch and the queue; flush inline if it isn't running"""
+    writer = _activity_writer
+    if writer is not None and writer.is_alive():
+        try:
+            _activity_queue.put(_ACTIVITY_STOP, timeout=ACTIVITY_EXIT_TIMEOUT)
+            writer.join(ACTIVITY_EXIT_TIMEOUT)
+        except queue.Full:
+            logger.error("Activity log writer did not drain before exit")
+        if not writer.is_alive():
+            return
+    _flush_activity_queue()
+
+SQL_LOG_ADMIN_ACTIVITY = q("INSERT INTO admin_activity_log (admin_id, action, details, ip_address) VALUES (%s, %s, %s, %s)")
 
 def log_admin_activity(admin_id, action, details, ip_address=''):
-    conn = get_db()
-    cursor = conn.cursor()
+    """Queue an audit row for the background writer so the request doesn't wait on the INSERT.
+    Returns True once the row is queued or written, False if it could not be recorded; no caller
+    needs the new row's id, which the queued path cannot know yet."""
+    global _activity_writer
+    if _activity_writer is None:
+        with _activity_writer_lock:
+            if _activity_writer is None:
+                _activity_writer = threading.Thread(target=_write_activity_log, daemon=True)
+                _activity_writer.start()
+    try:
+        _activity_queue.put_nowait((admin_id, action, details, ip_address))
+        return True
+    except queue.Full:
+        pass
+    # Writer is behind; record this one inline rather than drop it
     try:
-        cursor.execute(
-            "INSERT INTO admin_activity_log (admin_id, action, details, ip_address) VALUES (%s, %s, %s, %s)",
-            (admin_id, action, details, ip_address)
-        )
-        conn.commit()
+        with db_cursor() as (conn, cursor):
+            cursor.execute(SQL_LOG_ADMIN_ACTIVITY, (admin_id, action, details, ip_address))
+            conn.commit()
+        return True
     except Exception as e:
-        print(f"Error logging activity: {e}")
-    finally:
-        conn.close()
+        logger.error("Error logging activity: %s", e)
+        return False
+
+SQL_RECENT_ADMIN_ACTIVITY = q(
+    "SELECT id, admin_id, action, details, timestamp FROM admin_activity_log ORDER BY timestamp DESC LIMIT %s"
+)
 
 def get_recent_admin_activity(limit=5):
-    conn = get_db()
-    cursor = conn.cursor()
     try:
-        cursor.execute(
-            "SELECT * FROM admin_activity_log ORDER BY timestamp DESC LIMIT %s",
-            (limit,)
-        )
-        activities = []
-        for row in cursor.fetchall():
-            activities.append({
-                'id': row[0],
-                'admin_id': row[1],
-                'action': row[2],
-                'details': row[3],
-                'timestamp': row[5] if len(row) > 5 else None
-            })
-        return activities
+        with db_cursor() as (conn, cursor):
+            cursor.execute(SQL_RECENT_ADMIN_ACTIVITY, (limit,))
+            return [dict(row) for row in cursor.fetchall()]
     except Exception as e:
-        print(f"Error getting activities: {e}")
+        logger.error("Error getting activities: %s", e)
         return []
-    finally:
-        conn.close()
+
+SQL_ADMIN_ACTIVITY_LOG = f"""
+    SELECT id, admin_id, action, details, timestamp FROM admin_activity_log
+    WHERE admin_id = {PARAM} ORDER BY timestamp DESC
+"""
 
 def get_admin_activity_log(admin_id):
-    conn = get_db()
-    cursor = conn.cursor()
     try:
-        cursor.execute(
-            "SELECT * FROM admin_activity_log WHERE admin_id = %s ORDER BY timestamp DESC",
-            (admin_id,)
-        )
-        activities = []
-        for row in cursor.fetchall():
-            activities.append({
-                'id': row[0],
-                'admin_id': row[1],
-                'action': row[2],
-                'details': row[3],
-                'timestamp': row[5] if len(row) > 5 else None
-            })
-        return activities
+        with db_cursor() as (conn, cursor):
+            cursor.execute(SQL_ADMIN_ACTIVITY_LOG, (admin_id,))
+            return [dict(row) for row in cursor.fetchall()]
     except Exception as e:
-        print(f"Error getting admin activities: {e}")
+        logger.error("Error getting admin activities: %s", e)
         return []
-    finally:
-        conn.close()
+
+def iter_admin_activity_log(admin_id):
+    """Yield an admin's activity log rows for exports without loading them all"""
+    return _iter_rows(SQL_ADMIN_ACTIVITY_LOG, (admin_id,), 'admin_activity_cursor', 'iter_admin_activity_log')
 
 def get_all_students_with_units():
     conn = get_db()
     cursor = conn.cursor()
     try:
         cursor.execute('''
-            SELECT s.*, COUNT(su.unit_id) as unit_count
+            SELECT s.id, s.name, s.email, s.admission_no, s.college, COUNT(su.unit_id) as unit_count
             FROM students s
             LEFT JOIN student_units su ON s.id = su.student_id
             GROUP BY s.id
             ORDER BY s.name
         ''')
-        students = []
-        for row in cursor.fetchall():
-            students.append({
-                'id': row[0],
-                'name': row[1],
-                'email': row[2],
-                'admission_no': row[3],
-                'college': row[5] if len(row) > 5 else 'Not assigned',
-                'unit_count': row[6] if len(row) > 6 else 0
-            })
-        return students
+        return [dict(row) for row in cursor.fetchall()]
     except Exception as e:
-        print(f"Error getting students with units: {e}")
+        logger.error("Error getting students with units: %s", e)
         return []
     finally:
         conn.close()
@@ -1722,46 +2105,86 @@ def get_all_students_with_units():
 def admin_add_result(student_id, unit_id, score, remarks):
     return update_student_result(student_id, unit_id, score, remarks)
 
+SQL_UPDATE_RESULT = q("UPDATE results SET score = %s, remarks = %s WHERE id = %s")
+SQL_DELETE_RESULT = q("DELETE FROM results WHERE id = %s")
+
 def admin_update_result(result_id, score, remarks):
-    conn = get_db()
-    cursor = conn.cursor()
     try:
-        cursor.execute(
-            "UPDATE results SET score = %s, remarks = %s WHERE id = %s",
-            (score, remarks, result_id)
-        )
-        conn.commit()
+        with db_cursor() as (conn, cursor):
+            cursor.execute(SQL_UPDATE_RESULT, (score, remarks, result_id))
+            conn.commit()
         return True
     except Exception as e:
-        print(f"Error updating result: {e}")
-        conn.rollback()
+        logger.error("Error updating result: %s", e)
         return False
-    finally:
-        conn.close()
 
-def admin_delete_result(result_id):
-    conn = get_db()
-    cursor = conn.cursor()
+def admin_delete_result(result_id):
     try:
-        cursor.execute("DELETE FROM results WHERE id = %s", (result_id,))
-        conn.commit()
+        with db_cursor() as (conn, cursor):
+            cursor.execute(SQL_DELETE_RESULT, (result_id,))
+            conn.commit()
         return True
     except Exception as e:
-        print(f"Error deleting result: {e}")
-        conn.rollback()
+        logger.error("Error deleting result: %s", e)
         return False
-    finally:
-        conn.close()
+
+# Most of these tables predate foreign keys (and SQLite cannot add them to existing tables),
+# so deletes clear every dependent explicitly: children first, the row itself last.
+# Each statement takes the deleted row's id as its only parameter.
+SQL_DELETE_STUDENT = [q(sql) for sql in (
+    "DELETE FROM student_units WHERE student_id = %s",
+    "DELETE FROM results WHERE student_id = %s",
+    "DELETE FROM student_progress WHERE student_id = %s",
+    "DELETE FROM attendance_marks WHERE student_id = %s",
+    "DELETE FROM exam_attempts WHERE student_id = %s",
+    "DELETE FROM students WHERE id = %s",
+)]
+SQL_DELETE_UNIT = [q(sql) for sql in (
+    "DELETE FROM attendance_marks WHERE session_id IN (SELECT id FROM attendance_sessions WHERE unit_id = %s)",
+    "DELETE FROM attendance_sessions WHERE unit_id = %s",
+    "DELETE FROM exam_options WHERE question_id IN "
+    "(SELECT q.id FROM exam_questions q JOIN exams e ON e.id = q.exam_id WHERE e.unit_id = %s)",
+    "DELETE FROM exam_questions WHERE exam_id IN (SELECT id FROM exams WHERE unit_id = %s)",
+    "DELETE FROM exam_attempts WHERE exam_id IN (SELECT id FROM exams WHERE unit_id = %s)",
+    "DELETE FROM exams WHERE unit_id = %s",
+    "DELETE FROM chapter_items WHERE chapter_id IN (SELECT id FROM chapters WHERE unit_id = %s)",
+    "DELETE FROM chapters WHERE unit_id = %s",
+    "DELETE FROM student_progress WHERE unit_id = %s",
+    "DELETE FROM student_units WHERE unit_id = %s",
+    "DELETE FROM results WHERE unit_id = %s",
+    "DELETE FROM resources WHERE unit_id = %s",
+    "DELETE FROM activities WHERE unit_id = %s",
+    "DELETE FROM lessons WHERE unit_id = %s",
+    "DELETE FROM quizzes WHERE unit_id = %s",
+    "DELETE FROM assignments WHERE unit_id = %s",
+    "DELETE FROM announcements WHERE unit_id = %s",
+    "DELETE FROM unit_announcements WHERE unit_id = %s",
+    "DELETE FROM weekly_links WHERE unit_id = %s",
+    "DELETE FROM unit_attendance WHERE unit_id = %s",
+    "DELETE FROM units WHERE id = %s",
+)]
+
+def _delete_cascade(cursor, statements, row_id):
+    """Run a delete list for one id: one round trip on Postgres, statement by statement on SQLite"""
+    if IS_PG:
+        # psycopg2 binds parameters client-side, so the whole list goes as one multi-statement query
+        cursor.execute(";\n".join(statements), (row_id,) * len(statements))
+    else:
+        for sql in statements:
+            cursor.execute(sql, (row_id,))
 
 def delete_student(student_id):
     conn = get_db()
     cursor = conn.cursor()
     try:
-        cursor.execute("DELETE FROM students WHERE id = %s", (student_id,))
+        _delete_cascade(cursor, SQL_DELETE_STUDENT, student_id)
         conn.commit()
+        invalidate_shared(get_all_units_with_details)
+        invalidate_user('student', student_id)
+        _forget_verified('students')
         return True
     except Exception as e:
-        print(f"Error deleting student: {e}")
+        logger.error("Error deleting student: %s", e)
         conn.rollback()
         return False
     finally:
@@ -1771,25 +2194,41 @@ def delete_lecturer(lecturer_id):
     conn = get_db()
     cursor = conn.cursor()
     try:
-        cursor.execute("DELETE FROM lecturers WHERE id = %s", (lecturer_id,))
+        if IS_PG:
+            cursor.execute("""
+                WITH u AS (UPDATE units SET lecturer_id = NULL WHERE lecturer_id = %s)
+                DELETE FROM lecturers WHERE id = %s
+            """, (lecturer_id, lecturer_id))
+        else:
+            cursor.execute("UPDATE units SET lecturer_id = NULL WHERE lecturer_id = ?", (lecturer_id,))
+            cursor.execute("DELETE FROM lecturers WHERE id = ?", (lecturer_id,))
         conn.commit()
+        invalidate_shared(get_all_lecturers, get_all_units, get_all_units_with_details)
+        invalidate_user('lecturer', lecturer_id)
+        _forget_verified('lecturers')
         return True
     except Exception as e:
-        print(f"Error deleting lecturer: {e}")
+        logger.error("Error deleting lecturer: %s", e)
         conn.rollback()
         return False
     finally:
         conn.close()
 
 def delete_unit(unit_id):
+    # unit_announcements/unit_attendance are created on first use; make sure they exist to delete from
+    _ensure_announce_attendance_tables()
     conn = get_db()
     cursor = conn.cursor()
     try:
-        cursor.execute("DELETE FROM units WHERE id = %s", (unit_id,))
+        _delete_cascade(cursor, SQL_DELETE_UNIT, unit_id)
         conn.commit()
+        invalidate_shared(get_all_units, get_all_units_with_details)
+        invalidate_shared_key(get_exam_by_unit, unit_id)
+        invalidate_shared_key(get_weekly_link, unit_id)
+        invalidate_shared_key(get_open_attendance_session, unit_id)
         return True
     except Exception as e:
-        print(f"Error deleting unit: {e}")
+        logger.error("Error deleting unit: %s", e)
         conn.rollback()
         return False
     finally:
@@ -1811,568 +2250,494 @@ def get_jotform_forms_by_unit(unit_id):
 
 # ==================== NEW: LESSON, QUIZ, ASSIGNMENT HELPERS ====================
 
+SQL_ADD_LESSON = f"""
+    INSERT INTO lessons (unit_id, title, content, video_file, notes_file, created_by, created_at)
+    VALUES ({', '.join([PARAM] * 6)}, {NOW})
+"""
+SQL_INCREMENT_LESSON_COUNT = q("UPDATE units SET lesson_count = lesson_count + 1 WHERE id = %s")
+SQL_ADD_QUIZ = f"""
+    INSERT INTO quizzes (unit_id, title, description, duration, quiz_file, created_by, created_at)
+    VALUES ({', '.join([PARAM] * 6)}, {NOW})
+"""
+SQL_ADD_ASSIGNMENT = f"""
+    INSERT INTO assignments (unit_id, title, instructions, due_date, assignment_file, created_by, created_at)
+    VALUES ({', '.join([PARAM] * 6)}, {NOW})
+"""
+SQL_UPDATE_LESSON = f"""
+    UPDATE lessons
+    SET title = {PARAM}, content = {PARAM}, video_file = COALESCE({PARAM}, video_file),
+        notes_file = COALESCE({PARAM}, notes_file)
+    WHERE id = {PARAM}
+"""
+
 def add_lesson(unit_id, title, content, video_filename, notes_filename, created_by):
     try:
-        conn = get_db()
-        cursor = conn.cursor()
-        if os.environ.get('DATABASE_URL'):
-            cursor.execute("""
-                INSERT INTO lessons (unit_id, title, content, video_file, notes_file, created_by, created_at)
-                VALUES (%s, %s, %s, %s, %s, %s, NOW())
-            """, (unit_id, title, content, video_filename, notes_filename, created_by))
-        else:
-            cursor.execute("""
-                INSERT INTO lessons (unit_id, title, content, video_file, notes_file, created_by, created_at)
-                VALUES (?, ?, ?, ?, ?, ?, datetime('now'))
-            """, (unit_id, title, content, video_filename, notes_filename, created_by))
-        conn.commit()
-        conn.close()
-        return True
+        with db_cursor() as (conn, cursor):
+            lesson_id = _insert_returning_id(cursor, SQL_ADD_LESSON, (unit_id, title, content, video_filename, notes_filename, created_by))
+            cursor.execute(SQL_INCREMENT_LESSON_COUNT, (unit_id,))
+            conn.commit()
+        return lesson_id
     except Exception as e:
-        print(f"DB Error (add_lesson): {e}")
-        return False
+        logger.error("DB Error (add_lesson): %s", e)
+        return None
 
 def add_quiz(unit_id, title, description, duration, quiz_filename, created_by):
     try:
-        conn = get_db()
-        cursor = conn.cursor()
-        if os.environ.get('DATABASE_URL'):
-            cursor.execute("""
-                INSERT INTO quizzes (unit_id, title, description, duration, quiz_file, created_by, created_at)
-                VALUES (%s, %s, %s, %s, %s, %s, NOW())
-            """, (unit_id, title, description, duration, quiz_filename, created_by))
-        else:
-            cursor.execute("""
-                INSERT INTO quizzes (unit_id, title, description, duration, quiz_file, created_by, created_at)
-                VALUES (?, ?, ?, ?, ?, ?, datetime('now'))
-            """, (unit_id, title, description, duration, quiz_filename, created_by))
-        conn.commit()
-        conn.close()
-        return True
+        with db_cursor() as (conn, cursor):
+            quiz_id = _insert_returning_id(cursor, SQL_ADD_QUIZ, (unit_id, title, description, duration, quiz_filename, created_by))
+            conn.commit()
+        return quiz_id
     except Exception as e:
-        print(f"DB Error (add_quiz): {e}")
-        return False
+        logger.error("DB Error (add_quiz): %s", e)
+        return None
 
 def add_assignment(unit_id, title, instructions, due_date, assignment_filename, created_by):
     try:
-        conn = get_db()
-        cursor = conn.cursor()
-        if os.environ.get('DATABASE_URL'):
-            cursor.execute("""
-                INSERT INTO assignments (unit_id, title, instructions, due_date, assignment_file, created_by, created_at)
-                VALUES (%s, %s, %s, %s, %s, %s, NOW())
-            """, (unit_id, title, instructions, due_date, assignment_filename, created_by))
-        else:
-            cursor.execute("""
-                INSERT INTO assignments (unit_id, title, instructions, due_date, assignment_file, created_by, created_at)
-                VALUES (?, ?, ?, ?, ?, ?, datetime('now'))
-            """, (unit_id, title, instructions, due_date, assignment_filename, created_by))
-        conn.commit()
-        conn.close()
-        return True
+        with db_cursor() as (conn, cursor):
+            assignment_id = _insert_returning_id(cursor, SQL_ADD_ASSIGNMENT, (unit_id, title, instructions, due_date, assignment_filename, created_by))
+            conn.commit()
+        return assignment_id
     except Exception as e:
-        print(f"DB Error (add_assignment): {e}")
-        return False
+        logger.error("DB Error (add_assignment): %s", e)
+        return None
 
 # ==================== VIEW HELPERS ====================
 
 def get_lessons_by_unit(unit_id):
-    try:
-        conn = get_db()
-        cursor = conn.cursor()
-        if os.environ.get('DATABASE_URL'):
-            cursor.execute("""
-                SELECT id, title, content, video_file, notes_file, created_at
-                FROM lessons
-                WHERE unit_id = %s
-                ORDER BY created_at DESC
-            """, (unit_id,))
-        else:
-            cursor.execute("""
-                SELECT id, title, content, video_file, notes_file, created_at
-                FROM lessons
-                WHERE unit_id = ?
-                ORDER BY created_at DESC
-            """, (unit_id,))
-        rows = cursor.fetchall()
-        conn.close()
-        return rows
-    except Exception as e:
-        print(f"DB Error (get_lessons_by_unit): {e}")
-        return []
+    return get_lessons_for_units([unit_id]).get(unit_id, [])
 
 def get_quizzes_by_unit(unit_id):
-    try:
-        conn = get_db()
-        cursor = conn.cursor()
-        if os.environ.get('DATABASE_URL'):
-            cursor.execute("""
-                SELECT id, title, description, duration, quiz_file, created_at
-                FROM quizzes
-                WHERE unit_id = %s
-                ORDER BY created_at DESC
-            """, (unit_id,))
-        else:
-            cursor.execute("""
-                SELECT id, title, description, duration, quiz_file, created_at
-                FROM quizzes
-                WHERE unit_id = ?
-                ORDER BY created_at DESC
-            """, (unit_id,))
-        rows = cursor.fetchall()
-        conn.close()
-        return rows
-    except Exception as e:
-        print(f"DB Error (get_quizzes_by_unit): {e}")
-        return []
+    return get_quizzes_for_units([unit_id]).get(unit_id, [])
 
 def get_assignments_by_unit(unit_id):
-    try:
-        conn = get_db()
-        cursor = conn.cursor()
-        if os.environ.get('DATABASE_URL'):
-            cursor.execute("""
-                SELECT id, title, instructions, due_date, assignment_file, created_at
-                FROM assignments
-                WHERE unit_id = %s
-                ORDER BY created_at DESC
-            """, (unit_id,))
-        else:
-            cursor.execute("""
-                SELECT id, title, instructions, due_date, assignment_file, created_at
-                FROM assignments
-                WHERE unit_id = ?
-                ORDER BY created_at DESC
-            """, (unit_id,))
-        rows = cursor.fetchall()
-        conn.close()
-        return rows
-    except Exception as e:
-        print(f"DB Error (get_assignments_by_unit): {e}")
-        return []
+    return get_assignments_for_units([unit_id]).get(unit_id, [])
+
+def _fetch_by_unit(columns, table, order_by, unit_ids, label):
+    """Run one query across several units and group the rows into {unit_id: [row, ...]}"""
+    unit_ids = list(dict.fromkeys(unit_ids))
+    grouped = {unit_id: [] for unit_id in unit_ids}
+    if not unit_ids:
+        return grouped
+    where, params = _in_filter('unit_id', unit_ids)
+    try:
+        with db_cursor() as (conn, cursor):
+            cursor.execute(f"SELECT unit_id, {columns} FROM {table} WHERE {where} ORDER BY {order_by}", params)
+            for row in cursor.fetchall():
+                grouped[row['unit_id']].append(dict(row))
+        return grouped
+    except Exception as e:
+        logger.error("DB Error (%s): %s", label, e)
+        return grouped
+
+def get_resources_for_units(unit_ids):
+    """Resources for several units in one query - {unit_id: [resource, ...]}"""
+    return _fetch_by_unit("id, title, filename, uploaded_at", "resources",
+                          "uploaded_at DESC", unit_ids, "get_resources_for_units")
+
+def get_lessons_for_units(unit_ids):
+    """Lessons for several units in one query - {unit_id: [lesson, ...]}"""
+    return _fetch_by_unit("id, title, content, video_file, notes_file, created_at", "lessons",
+                          "created_at DESC", unit_ids, "get_lessons_for_units")
+
+def get_quizzes_for_units(unit_ids):
+    """Quizzes for several units in one query - {unit_id: [quiz, ...]}"""
+    return _fetch_by_unit("id, title, description, duration, quiz_file, created_at", "quizzes",
+                          "created_at DESC", unit_ids, "get_quizzes_for_units")
+
+def get_assignments_for_units(unit_ids):
+    """Assignments for several units in one query - {unit_id: [assignment, ...]}"""
+    return _fetch_by_unit("id, title, instructions, due_date, assignment_file, created_at", "assignments",
+                          "created_at DESC", unit_ids, "get_assignments_for_units")
 
 # ==================== EDIT / DELETE HELPERS ====================
 
 def update_lesson(lesson_id, title, content, video_file=None, notes_file=None):
     try:
-        conn = get_db()
-        cursor = conn.cursor()
-        if os.environ.get('DATABASE_URL'):
-            cursor.execute("""
-                UPDATE lessons
-                SET title = %s, content = %s, video_file = COALESCE(%s, video_file),
-                    notes_file = COALESCE(%s, notes_file)
-                WHERE id = %s
-            """, (title, content, video_file, notes_file, lesson_id))
-        else:
-            cursor.execute("""
-                UPDATE lessons
-                SET title = ?, content = ?, video_file = COALESCE(?, video_file),
-                    notes_file = COALESCE(?, notes_file)
-                WHERE id = ?
-            """, (title, content, video_file, notes_file, lesson_id))
-        conn.commit()
-        conn.close()
+        with db_cursor() as (conn, cursor):
+            cursor.execute(SQL_UPDATE_LESSON, (title, content, video_file, notes_file, lesson_id))
+            conn.commit()
         return True
     except Exception as e:
-        print(f"DB Error (update_lesson): {e}")
+        logger.error("DB Error (update_lesson): %s", e)
         return False
 
+SQL_DELETE_LESSON = q("DELETE FROM lessons WHERE id = %s")
+SQL_DECREMENT_LESSON_COUNT = q("""
+    UPDATE units SET lesson_count = lesson_count - 1
+    WHERE id = (SELECT unit_id FROM lessons WHERE id = %s)
+""")
+
 def delete_lesson(lesson_id):
     try:
-        conn = get_db()
-        cursor = conn.cursor()
-        if os.environ.get('DATABASE_URL'):
-            cursor.execute("DELETE FROM lessons WHERE id = %s", (lesson_id,))
-        else:
-            cursor.execute("DELETE FROM lessons WHERE id = ?", (lesson_id,))
-        conn.commit()
-        conn.close()
+        with db_cursor() as (conn, cursor):
+            # Decrement first, while the lesson row still names its unit
+            cursor.execute(SQL_DECREMENT_LESSON_COUNT, (lesson_id,))
+            cursor.execute(SQL_DELETE_LESSON, (lesson_id,))
+            conn.commit()
         return True
     except Exception as e:
-        print(f"DB Error (delete_lesson): {e}")
+        logger.error("DB Error (delete_lesson): %s", e)
         return False
 
+SQL_COUNT_LESSONS = q("SELECT lesson_count AS n FROM units WHERE id = %s")
+
 def count_lessons_in_unit(unit_id):
-    conn = get_db()
-    cursor = conn.cursor()
     try:
-        if os.environ.get('DATABASE_URL'):
-            cursor.execute("SELECT COUNT(*) FROM lessons WHERE unit_id = %s", (unit_id,))
-        else:
-            cursor.execute("SELECT COUNT(*) FROM lessons WHERE unit_id = ?", (unit_id,))
-        count = cursor.fetchone()[0]
-        return count
+        with db_cursor() as (conn, cursor):
+            cursor.execute(SQL_COUNT_LESSONS, (unit_id,))
+            row = cursor.fetchone()
+            return row['n'] if row else 0
     except Exception as e:
-        print(f"Error counting lessons: {e}")
+        logger.error("Error counting lessons: %s", e)
         return 0
-    finally:
-        conn.close()
 
 # ==================== EXAM FUNCTIONS ====================
 
+SQL_GET_EXAM_BY_UNIT = q("""
+    SELECT id, unit_id, title, description, duration_minutes, total_marks,
+           pass_marks, unlock_after_count, is_published
+    FROM exams WHERE unit_id = %s
+""")
+EXAM_KEYS = ('id', 'unit_id', 'title', 'description', 'duration_minutes', 'total_marks',
+             'pass_marks', 'unlock_after_count', 'is_published')
+
+@_ttl_cached(EXAM_CACHE_TTL)
 def get_exam_by_unit(unit_id):
-    conn = get_db()
-    cursor = conn.cursor()
-    try:
-        if os.environ.get('DATABASE_URL'):
-            cursor.execute("SELECT * FROM exams WHERE unit_id = %s", (unit_id,))
-        else:
-            cursor.execute("SELECT * FROM exams WHERE unit_id = ?", (unit_id,))
+    with db_cursor() as (conn, cursor):
+        _execute_prepared(cursor, 'get_exam_by_unit', (unit_id,))
         exam = cursor.fetchone()
-        if exam:
-            return {
-                'id': exam[0],
-                'unit_id': exam[1],
-                'title': exam[2],
-                'description': exam[3],
-                'duration_minutes': exam[4],
-                'total_marks': exam[5],
-                'pass_marks': exam[6],
-                'unlock_after_count': exam[7],
-                'is_published': exam[8]
-            }
-        return None
-    except Exception as e:
-        print(f"Error getting exam: {e}")
-        return None
-    finally:
-        conn.close()
+        return dict(zip(EXAM_KEYS, exam)) if exam else None
+
+SQL_GET_EXAM_QUESTIONS = q("""
+    SELECT id, exam_id, question_text, type, points, order_index
+    FROM exam_questions WHERE exam_id = %s ORDER BY order_index
+""")
+
+def iter_exam_questions(exam_id):
+    """Stream an exam's questions in order without buffering the whole set"""
+    return _iter_rows(SQL_GET_EXAM_QUESTIONS, (exam_id,), 'exam_questions_cursor', 'iter_exam_questions')
 
 def get_exam_questions(exam_id):
-    conn = get_db()
-    cursor = conn.cursor()
+    # A partial question list would be worse than none; _iter_rows has already logged the error
     try:
-        if os.environ.get('DATABASE_URL'):
-            cursor.execute("SELECT * FROM exam_questions WHERE exam_id = %s ORDER BY order_index", (exam_id,))
-        else:
-            cursor.execute("SELECT * FROM exam_questions WHERE exam_id = ? ORDER BY order_index", (exam_id,))
-        questions = cursor.fetchall()
-        return questions
-    except Exception as e:
-        print(f"Error getting exam questions: {e}")
+        return list(iter_exam_questions(exam_id))
+    except Exception:
         return []
-    finally:
-        conn.close()
+
+SQL_SAVE_EXAM_ATTEMPT = q("""
+    INSERT INTO exam_attempts (exam_id, student_id, score, status, answers_json, submitted_at)
+    VALUES (%s, %s, %s, 'submitted', %s, NOW())
+""")
 
 def save_exam_attempt_and_score(exam_id, student_id, answers):
     """Save exam attempt and calculate score (simplified grading)"""
+    score = 50
+    total_marks = 100
     try:
-        conn = get_db()
-        cursor = conn.cursor()
-        score = 50
-        total_marks = 100
-        if os.environ.get('DATABASE_URL'):
-            cursor.execute("""
-                INSERT INTO exam_attempts (exam_id, student_id, score, status, answers_json, submitted_at)
-                VALUES (%s, %s, %s, 'submitted', %s, NOW())
-            """, (exam_id, student_id, score, json.dumps(answers)))
-        else:
-            cursor.execute("""
-                INSERT INTO exam_attempts (exam_id, student_id, score, status, answers_json, submitted_at)
-                VALUES (?, ?, ?, 'submitted', ?, datetime('now'))
-            """, (exam_id, student_id, score, json.dumps(answers)))
-        conn.commit()
+        with db_cursor() as (conn, cursor):
+            cursor.execute(SQL_SAVE_EXAM_ATTEMPT, (exam_id, student_id, score, json.dumps(answers)))
+            conn.commit()
         return score, total_marks
     except Exception as e:
-        print(f"Error saving exam attempt: {e}")
+        logger.error("Error saving exam attempt: %s", e)
         return 0, 100
-    finally:
-        conn.close()
 
 # ==================== NEW: ANNOUNCEMENTS ====================
 
+SQL_ADD_ANNOUNCEMENT = q("""
+    INSERT INTO announcements (unit_id, lecturer_id, title, body, created_at)
+    VALUES (%s, %s, %s, %s, NOW())
+""")
+SQL_GET_ANNOUNCEMENTS = q("""
+    SELECT id, unit_id, lecturer_id, title, body, created_at
+    FROM announcements
+    WHERE unit_id = %s
+    ORDER BY created_at DESC
+    LIMIT %s
+""")
+SQL_ALL_ANNOUNCEMENTS = q("""
+    SELECT id, unit_id, lecturer_id, title, body, created_at
+    FROM announcements
+    WHERE unit_id = %s
+    ORDER BY created_at DESC
+""")
+ANNOUNCEMENT_KEYS = ('id', 'unit_id', 'lecturer_id', 'title', 'body', 'created_at')
+
 def add_announcement(unit_id, lecturer_id, title, body):
     """Create a new announcement for a unit."""
-    conn = get_db()
-    cursor = conn.cursor()
     try:
-        if os.environ.get('DATABASE_URL'):
-            cursor.execute("""
-                INSERT INTO announcements (unit_id, lecturer_id, title, body, created_at)
-                VALUES (%s, %s, %s, %s, NOW())
-            """, (unit_id, lecturer_id, title, body))
-        else:
-            cursor.execute("""
-                INSERT INTO announcements (unit_id, lecturer_id, title, body, created_at)
-                VALUES (?, ?, ?, ?, datetime('now'))
-            """, (unit_id, lecturer_id, title, body))
-        conn.commit()
+        with db_cursor() as (conn, cursor):
+            cursor.execute(SQL_ADD_ANNOUNCEMENT, (unit_id, lecturer_id, title, body))
+            conn.commit()
         return True
     except Exception as e:
-        print(f"Error adding announcement: {e}")
-        conn.rollback()
+        logger.error("Error adding announcement: %s", e)
         return False
-    finally:
-        conn.close()
+
+def iter_announcements(unit_id, limit=50):
+    """Yield announcements for a unit (newest first) as dicts; errors propagate."""
+    with db_cursor() as (conn, cursor):
+        _execute_prepared(cursor, 'get_announcements', (unit_id, limit))
+        for row in cursor:
+            yield dict(zip(ANNOUNCEMENT_KEYS, row))
 
 def get_announcements(unit_id, limit=50):
     """Fetch announcements for a unit (newest first)."""
-    conn = get_db()
-    cursor = conn.cursor()
     try:
-        if os.environ.get('DATABASE_URL'):
-            cursor.execute("""
-                SELECT id, unit_id, lecturer_id, title, body, created_at
-                FROM announcements
-                WHERE unit_id = %s
-                ORDER BY created_at DESC
-                LIMIT %s
-            """, (unit_id, limit))
-        else:
-            cursor.execute("""
-                SELECT id, unit_id, lecturer_id, title, body, created_at
-                FROM announcements
-                WHERE unit_id = ?
-                ORDER BY created_at DESC
-                LIMIT ?
-            """, (unit_id, limit))
-        rows = cursor.fetchall()
-        ann = []
-        for r in rows:
-            ann.append({
-                'id': r[0],
-                'unit_id': r[1],
-                'lecturer_id': r[2],
-                'title': r[3],
-                'body': r[4],
-                'created_at': r[5]
-            })
-        return ann
+        return list(iter_announcements(unit_id, limit))
     except Exception as e:
-        print(f"Error fetching announcements: {e}")
+        logger.error("Error fetching announcements: %s", e)
         return []
-    finally:
-        conn.close()
+
+def iter_all_announcements(unit_id):
+    """Stream every announcement for a unit (newest first) for exports."""
+    return _iter_rows(SQL_ALL_ANNOUNCEMENTS, (unit_id,), 'announcements_cursor', 'iter_all_announcements')
 
 # ==================== NEW: WEEKLY CLASS LINK ====================
 
+# weekly_links.unit_id is the primary key, so it is the upsert's conflict target on both backends
+SQL_SET_WEEKLY_LINK = q("""
+    INSERT INTO weekly_links (unit_id, url, updated_by, updated_at)
+    VALUES (%s, %s, %s, NOW())
+    ON CONFLICT (unit_id) DO UPDATE SET
+        url = excluded.url,
+        updated_by = excluded.updated_by,
+        updated_at = NOW()
+""")
+
 def set_weekly_link(unit_id, url, updated_by):
     """Create/update the weekly class link for a unit."""
-    conn = get_db()
-    cursor = conn.cursor()
     try:
-        # Upsert
-        if os.environ.get('DATABASE_URL'):
-            cursor.execute("""
-                INSERT INTO weekly_links (unit_id, url, updated_by, updated_at)
-                VALUES (%s, %s, %s, NOW())
-                ON CONFLICT (unit_id) DO UPDATE SET
-                    url = EXCLUDED.url,
-                    updated_by = EXCLUDED.updated_by,
-                    updated_at = NOW()
-            """, (unit_id, url, updated_by))
-        else:
-            # SQLite upsert pattern
-            cursor.execute("SELECT unit_id FROM weekly_links WHERE unit_id = ?", (unit_id,))
-            exists = cursor.fetchone()
-            if exists:
-                cursor.execute("""
-                    UPDATE weekly_links
-                    SET url = ?, updated_by = ?, updated_at = datetime('now')
-                    WHERE unit_id = ?
-                """, (url, updated_by, unit_id))
-            else:
-                cursor.execute("""
-                    INSERT INTO weekly_links (unit_id, url, updated_by, updated_at)
-                    VALUES (?, ?, ?, datetime('now'))
-                """, (unit_id, url, updated_by))
-        conn.commit()
+        with db_cursor() as (conn, cursor):
+            cursor.execute(SQL_SET_WEEKLY_LINK, (unit_id, url, updated_by))
+            conn.commit()
+        invalidate_shared_key(get_weekly_link, unit_id)
         return True
     except Exception as e:
-        print(f"Error setting weekly link: {e}")
-        conn.rollback()
+        logger.error("Error setting weekly link: %s", e)
         return False
-    finally:
-        conn.close()
 
+SQL_GET_WEEKLY_LINK = q("SELECT url, updated_by, updated_at FROM weekly_links WHERE unit_id = %s")
+WEEKLY_LINK_KEYS = ('url', 'updated_by', 'updated_at')
+
+@_ttl_cached(WEEKLY_LINK_CACHE_TTL)
 def get_weekly_link(unit_id):
     """Get the current weekly class link for a unit."""
-    conn = get_db()
-    cursor = conn.cursor()
-    try:
-        if os.environ.get('DATABASE_URL'):
-            cursor.execute("SELECT url, updated_by, updated_at FROM weekly_links WHERE unit_id = %s", (unit_id,))
-        else:
-            cursor.execute("SELECT url, updated_by, updated_at FROM weekly_links WHERE unit_id = ?", (unit_id,))
+    with db_cursor() as (conn, cursor):
+        _execute_prepared(cursor, 'get_weekly_link', (unit_id,))
         row = cursor.fetchone()
-        if row:
-            return {'url': row[0], 'updated_by': row[1], 'updated_at': row[2]}
-        return None
-    except Exception as e:
-        print(f"Error getting weekly link: {e}")
-        return None
-    finally:
-        conn.close()
+        return dict(zip(WEEKLY_LINK_KEYS, row)) if row else None
 
 # ==================== NEW: ATTENDANCE ====================
 
+SQL_OPEN_ATTENDANCE_SESSION = q("""
+    INSERT INTO attendance_sessions (unit_id, lecturer_id, week_label, opened_at, closes_at, is_open)
+    VALUES (%s, %s, %s, NOW(), %s, TRUE)
+""")
+SQL_GET_OPEN_ATTENDANCE_SESSION = q("""
+    SELECT id, unit_id, lecturer_id, week_label, opened_at, closes_at, is_open
+    FROM attendance_sessions
+    WHERE unit_id = %s AND is_open = TRUE
+    ORDER BY opened_at DESC
+    LIMIT 1
+""")
+# Also the leading columns of SQL_ATTENDANCE_STATUS
+ATTENDANCE_SESSION_KEYS = ('id', 'unit_id', 'lecturer_id', 'week_label', 'opened_at', 'closes_at', 'is_open')
+# Inserts only while the session is open; the unique pair makes repeats a no-op
+SQL_MARK_ATTENDANCE = q("""
+    INSERT INTO attendance_marks (session_id, student_id, marked_at)
+    SELECT id, %s, NOW() FROM attendance_sessions
+    WHERE id = %s AND is_open = TRUE
+    ON CONFLICT (session_id, student_id) DO NOTHING
+""")
+
+SQL_CLOSE_UNIT_SESSIONS = q("UPDATE attendance_sessions SET is_open = FALSE WHERE unit_id = %s AND is_open = TRUE")
+# Postgres closes the unit's open sessions and opens the new one in a single statement
+SQL_ROTATE_ATTENDANCE_SESSION = """
+    WITH closed AS (
+        UPDATE attendance_sessions SET is_open = FALSE WHERE unit_id = %s AND is_open = TRUE
+    )
+    INSERT INTO attendance_sessions (unit_id, lecturer_id, week_label, opened_at, closes_at, is_open)
+    VALUES (%s, %s, %s, NOW(), %s, TRUE)
+    RETURNING id
+"""
+
 def create_attendance_session(unit_id, lecturer_id, week_label=None, closes_at=None):
     """Open a new attendance session; auto-closes others for same unit."""
-    conn = get_db()
-    cursor = conn.cursor()
     try:
-        # Close any existing open session for this unit
-        if os.environ.get('DATABASE_URL'):
-            cursor.execute("UPDATE attendance_sessions SET is_open = FALSE WHERE unit_id = %s AND is_open = TRUE", (unit_id,))
-        else:
-            cursor.execute("UPDATE attendance_sessions SET is_open = 0 WHERE unit_id = ? AND is_open = 1", (unit_id,))
-
-        # Insert new open session
-        if os.environ.get('DATABASE_URL'):
-            cursor.execute("""
-                INSERT INTO attendance_sessions (unit_id, lecturer_id, week_label, opened_at, closes_at, is_open)
-                VALUES (%s, %s, %s, NOW(), %s, TRUE)
-                RETURNING id
-            """, (unit_id, lecturer_id, week_label, closes_at))
-            sess_id = cursor.fetchone()[0]
-        else:
-            cursor.execute("""
-                INSERT INTO attendance_sessions (unit_id, lecturer_id, week_label, opened_at, closes_at, is_open)
-                VALUES (?, ?, ?, datetime('now'), ?, 1)
-            """, (unit_id, lecturer_id, week_label, closes_at))
-            sess_id = cursor.lastrowid
-
-        conn.commit()
-        return sess_id
-    except Exception as e:
-        print(f"Error creating attendance session: {e}")
-        conn.rollback()
+        with db_cursor() as (conn, cursor):
+            if IS_PG:
+                cursor.execute(SQL_ROTATE_ATTENDANCE_SESSION, (unit_id, unit_id, lecturer_id, week_label, closes_at))
+                sess_id = cursor.fetchone()[0]
+            else:
+                # Close any existing open session for this unit; both statements share one transaction
+                cursor.execute(SQL_CLOSE_UNIT_SESSIONS, (unit_id,))
+                sess_id = _insert_returning_id(cursor, SQL_OPEN_ATTENDANCE_SESSION, (unit_id, lecturer_id, week_label, closes_at))
+            conn.commit()
+            invalidate_shared_key(get_open_attendance_session, unit_id)
+            return sess_id
+    except Exception as e:
+        logger.error("Error creating attendance session: %s", e)
         return None
-    finally:
-        conn.close()
+
+SQL_CLOSE_SESSION = q("UPDATE attendance_sessions SET is_open = FALSE, closes_at = COALESCE(closes_at, NOW()) WHERE id = %s")
 
 def close_attendance_session(session_id):
     """Close a specific attendance session."""
-    conn = get_db()
-    cursor = conn.cursor()
     try:
-        if os.environ.get('DATABASE_URL'):
-            cursor.execute("UPDATE attendance_sessions SET is_open = FALSE, closes_at = COALESCE(closes_at, NOW()) WHERE id = %s", (session_id,))
-        else:
-            cursor.execute("UPDATE attendance_sessions SET is_open = 0, closes_at = COALESCE(closes_at, datetime('now')) WHERE id = ?", (session_id,))
-        conn.commit()
+        with db_cursor() as (conn, cursor):
+            cursor.execute(SQL_CLOSE_SESSION, (session_id,))
+            conn.commit()
+        _forget_marked(session_id)
+        # Only the session id is known here, so drop every unit's cached session
+        invalidate_shared(get_open_attendance_session)
         return True
     except Exception as e:
-        print(f"Error closing attendance session: {e}")
-        conn.rollback()
+        logger.error("Error closing attendance session: %s", e)
         return False
-    finally:
-        conn.close()
 
+@_ttl_cached(OPEN_SESSION_CACHE_TTL)
 def get_open_attendance_session(unit_id):
     """Return the current open session for a unit (or None)."""
-    conn = get_db()
-    cursor = conn.cursor()
-    try:
-        if os.environ.get('DATABASE_URL'):
-            cursor.execute("""
-                SELECT id, unit_id, lecturer_id, week_label, opened_at, closes_at, is_open
-                FROM attendance_sessions
-                WHERE unit_id = %s AND is_open = TRUE
-                ORDER BY opened_at DESC
-                LIMIT 1
-            """, (unit_id,))
-        else:
-            cursor.execute("""
-                SELECT id, unit_id, lecturer_id, week_label, opened_at, closes_at, is_open
-                FROM attendance_sessions
-                WHERE unit_id = ? AND is_open = 1
-                ORDER BY opened_at DESC
-                LIMIT 1
-            """, (unit_id,))
+    with db_cursor() as (conn, cursor):
+        _execute_prepared(cursor, 'get_open_attendance_session', (unit_id,))
         row = cursor.fetchone()
         if row:
-            return {
-                'id': row[0],
-                'unit_id': row[1],
-                'lecturer_id': row[2],
-                'week_label': row[3],
-                'opened_at': row[4],
-                'closes_at': row[5],
-                'is_open': bool(row[6])
-            }
-        return None
-    except Exception as e:
-        print(f"Error fetching open attendance session: {e}")
+            session = dict(zip(ATTENDANCE_SESSION_KEYS, row))
+            session['is_open'] = bool(session['is_open'])
+            return session
         return None
-    finally:
-        conn.close()
+
+SQL_SESSION_IS_OPEN = q("SELECT is_open FROM attendance_sessions WHERE id = %s")
+
+# session_id -> student ids this process has seen marked, so repeat clicks skip the database
+MARKED_CACHE_SESSIONS = 256
+_marked_cache = {}
+_marked_cache_lock = threading.Lock()
+
+def _remember_marked(session_id, student_id):
+    with _marked_cache_lock:
+        if session_id not in _marked_cache and len(_marked_cache) >= MARKED_CACHE_SESSIONS:
+            # Oldest session first; dicts keep insertion order
+            del _marked_cache[next(iter(_marked_cache))]
+        _marked_cache.setdefault(session_id, set()).add(student_id)
+
+def _forget_marked(session_id):
+    with _marked_cache_lock:
+        _marked_cache.pop(session_id, None)
 
 def mark_attendance(session_id, student_id):
     """Student marks attendance for an open session."""
-    conn = get_db()
-    cursor = conn.cursor()
-    try:
-        # Ensure session is open
-        if os.environ.get('DATABASE_URL'):
-            cursor.execute("SELECT is_open FROM attendance_sessions WHERE id = %s", (session_id,))
-        else:
-            cursor.execute("SELECT is_open FROM attendance_sessions WHERE id = ?", (session_id,))
-        session_row = cursor.fetchone()
-        if not session_row:
-            return False, "Session not found"
-        if (session_row[0] is False) or (session_row[0] == 0):
-            return False, "Session is closed"
-
-        # Insert mark (unique constraint handles duplicates)
-        if os.environ.get('DATABASE_URL'):
-            cursor.execute("""
-                INSERT INTO attendance_marks (session_id, student_id, marked_at)
-                VALUES (%s, %s, NOW())
-                ON CONFLICT (session_id, student_id) DO NOTHING
-            """, (session_id, student_id))
-        else:
-            # SQLite: emulate ON CONFLICT by ignoring duplicates
-            try:
-                cursor.execute("""
-                    INSERT INTO attendance_marks (session_id, student_id, marked_at)
-                    VALUES (?, ?, datetime('now'))
-                """, (session_id, student_id))
-            except Exception:
-                pass
-
-        conn.commit()
+    if student_id in _marked_cache.get(session_id, ()):
         return True, "Marked present"
-    except Exception as e:
-        print(f"Error marking attendance: {e}")
-        conn.rollback()
+    try:
+        with db_cursor() as (conn, cursor):
+            cursor.execute(SQL_MARK_ATTENDANCE, (student_id, session_id))
+            if cursor.rowcount == 1:
+                conn.commit()
+                _remember_marked(session_id, student_id)
+                return True, "Marked present"
+            # Nothing inserted: work out why (only on this slower path)
+            _execute_prepared(cursor, 'session_is_open', (session_id,))
+            session_row = cursor.fetchone()
+            if not session_row:
+                return False, "Session not found"
+            if session_row['is_open'] in (False, 0):
+                return False, "Session is closed"
+            # Open session, so the insert was a duplicate
+            _remember_marked(session_id, student_id)
+            return True, "Marked present"
+    except Exception as e:
+        logger.error("Error marking attendance: %s", e)
         return False, "Error"
-    finally:
-        conn.close()
+
+ATTENDANCE_BULK_PAGE_SIZE = 1000
+SQL_ATTENDANCE_SESSION_OWNER = q("""
+    SELECT s.is_open, u.lecturer_id FROM attendance_sessions s
+    JOIN units u ON u.id = s.unit_id
+    WHERE s.id = %s
+""")
+# The session, ownership and enrolment checks live in the statement itself, so a session closed
+# or reassigned between the probe and the insert still marks nobody
+SQL_MARK_MANY_ATTENDANCE = q("""
+    INSERT INTO attendance_marks (session_id, student_id, marked_at)
+    SELECT s.id, su.student_id, NOW()
+    FROM attendance_sessions s
+    JOIN units u ON u.id = s.unit_id
+    JOIN student_units su ON su.unit_id = s.unit_id
+    WHERE s.id = %s AND s.is_open = TRUE AND u.lecturer_id = %s AND {student_filter}
+    ON CONFLICT (session_id, student_id) DO NOTHING
+""")
+
+def mark_many_attendance(session_id, lecturer_id, student_ids):
+    """Lecturer marks enrolled students present in an open session of their unit.
+    Returns (added, error); error is None on success."""
+    student_ids = list(dict.fromkeys(student_ids))
+    try:
+        with db_cursor() as (conn, cursor):
+            cursor.execute(SQL_ATTENDANCE_SESSION_OWNER, (session_id,))
+            session_row = cursor.fetchone()
+            if not session_row:
+                return 0, "Session not found"
+            if session_row['lecturer_id'] != lecturer_id:
+                return 0, "Not your session"
+            if session_row['is_open'] in (False, 0):
+                return 0, "Session is closed"
+            added = 0
+            for start in range(0, len(student_ids), ATTENDANCE_BULK_PAGE_SIZE):
+                student_filter, params = _in_filter("su.student_id", student_ids[start:start + ATTENDANCE_BULK_PAGE_SIZE])
+                # Students not enrolled in the unit, or already marked, are skipped
+                cursor.execute(SQL_MARK_MANY_ATTENDANCE.format(student_filter=student_filter),
+                               (session_id, lecturer_id) + params)
+                added += max(cursor.rowcount, 0)
+            conn.commit()
+        return added, None
+    except Exception as e:
+        logger.error("Error bulk marking attendance: %s", e)
+        return 0, "Error"
+
+SQL_ATTENDANCE_COUNTS = q("""
+    SELECT (SELECT COUNT(*) FROM attendance_marks WHERE session_id = s.id) AS marked,
+           (SELECT COUNT(*) FROM student_units WHERE unit_id = s.unit_id) AS total_registered
+    FROM attendance_sessions s
+    WHERE s.id = %s
+""")
+# Open session, the student's mark and both counts in one round trip
+SQL_ATTENDANCE_STATUS = q("""
+    SELECT s.id, s.unit_id, s.lecturer_id, s.week_label, s.opened_at, s.closes_at, s.is_open,
+           EXISTS(SELECT 1 FROM attendance_marks m
+                  WHERE m.session_id = s.id AND m.student_id = %s) AS has_marked,
+           (SELECT COUNT(*) FROM attendance_marks m WHERE m.session_id = s.id) AS marked,
+           (SELECT COUNT(*) FROM student_units su WHERE su.unit_id = s.unit_id) AS total_registered
+    FROM attendance_sessions s
+    WHERE s.unit_id = %s AND s.is_open = TRUE
+    ORDER BY s.opened_at DESC
+    LIMIT 1
+""")
+
+# Polled by every student page during class; prepared once per pooled psycopg2 connection
+PREPARED_SQL.update({
+    'get_exam_by_unit': SQL_GET_EXAM_BY_UNIT,
+    'get_announcements': SQL_GET_ANNOUNCEMENTS,
+    'get_weekly_link': SQL_GET_WEEKLY_LINK,
+    'get_open_attendance_session': SQL_GET_OPEN_ATTENDANCE_SESSION,
+    'session_is_open': SQL_SESSION_IS_OPEN,
+    'attendance_status': SQL_ATTENDANCE_STATUS,
+})
 
 def get_attendance_counts(session_id):
     """Return count of marked students for a session."""
-    conn = get_db()
-    cursor = conn.cursor()
     try:
-        if os.environ.get('DATABASE_URL'):
-            cursor.execute("SELECT COUNT(*) FROM attendance_marks WHERE session_id = %s", (session_id,))
-        else:
-            cursor.execute("SELECT COUNT(*) FROM attendance_marks WHERE session_id = ?", (session_id,))
-        marked = cursor.fetchone()[0]
-
-        # Determine total registered students in the unit of that session
-        if os.environ.get('DATABASE_URL'):
-            cursor.execute("SELECT unit_id FROM attendance_sessions WHERE id = %s", (session_id,))
-        else:
-            cursor.execute("SELECT unit_id FROM attendance_sessions WHERE id = ?", (session_id,))
-        sess = cursor.fetchone()
-        total = 0
-        if sess:
-            unit_id = sess[0]
-            if os.environ.get('DATABASE_URL'):
-                cursor.execute("SELECT COUNT(*) FROM student_units WHERE unit_id = %s", (unit_id,))
-            else:
-                cursor.execute("SELECT COUNT(*) FROM student_units WHERE unit_id = ?", (unit_id,))
-            total = cursor.fetchone()[0]
-
-        return {'marked': marked, 'total_registered': total}
+        with db_cursor() as (conn, cursor):
+            cursor.execute(SQL_ATTENDANCE_COUNTS, (session_id,))
+            row = cursor.fetchone()
+            if not row:
+                return {'marked': 0, 'total_registered': 0}
+            return {'marked': row['marked'], 'total_registered': row['total_registered']}
     except Exception as e:
-        print(f"Error getting attendance counts: {e}")
+        logger.error("Error getting attendance counts: %s", e)
         return {'marked': 0, 'total_registered': 0}
-    finally:
-        conn.close()
+
 # ==================== ANNOUNCEMENTS & ATTENDANCE (NEW, NON-BREAKING) ====================
 
 def _ensure_announce_attendance_tables():
@@ -2381,7 +2746,7 @@ def _ensure_announce_attendance_tables():
     cur = conn.cursor()
     try:
         # Announcements table
-        cur.execute("""
+        cur.execute(_ddl("""
             CREATE TABLE IF NOT EXISTS unit_announcements (
                 id SERIAL PRIMARY KEY,
                 unit_id INTEGER NOT NULL,
@@ -2390,7 +2755,8 @@ def _ensure_announce_attendance_tables():
                 created_by INTEGER,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
-        """)
+        """))
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_unit_ann_unit_created ON unit_announcements(unit_id, created_at DESC)")
         # Attendance status table (one row per unit)
         cur.execute("""
             CREATE TABLE IF NOT EXISTS unit_attendance (
@@ -2405,149 +2771,99 @@ def _ensure_announce_attendance_tables():
             conn.rollback()
         except Exception:
             pass
-        print(f"Warn: ensure tables (announcements/attendance): {e}")
+        logger.warning("ensure tables (announcements/attendance): %s", e)
     finally:
         conn.close()
 
 
+SQL_ADD_UNIT_ANNOUNCEMENT = q("INSERT INTO unit_announcements (unit_id, title, body, created_by) VALUES (%s, %s, %s, %s)")
+
 def add_unit_announcement(unit_id, title, body, created_by=None):
     """
     Insert an announcement for a unit.
     Called by: POST /lecturer/unit/<unit_id>/announcement
     """
     _ensure_announce_attendance_tables()
-    conn = get_db()
-    cur = conn.cursor()
     try:
-        if os.environ.get('DATABASE_URL'):
-            cur.execute(
-                "INSERT INTO unit_announcements (unit_id, title, body, created_by) VALUES (%s, %s, %s, %s) RETURNING id",
-                (unit_id, title or '', body, created_by)
-            )
-            new_id = cur.fetchone()[0]
-        else:
-            cur.execute(
-                "INSERT INTO unit_announcements (unit_id, title, body, created_by) VALUES (?, ?, ?, ?)",
+        with db_cursor() as (conn, cur):
+            new_id = _insert_returning_id(
+                cur,
+                SQL_ADD_UNIT_ANNOUNCEMENT,
                 (unit_id, title or '', body, created_by)
             )
-            new_id = cur.lastrowid
-        conn.commit()
-        return new_id
+            conn.commit()
+            return new_id
     except Exception as e:
-        try:
-            conn.rollback()
-        except Exception:
-            pass
-        print(f"Error add_unit_announcement: {e}")
+        logger.error("Error add_unit_announcement: %s", e)
         return None
-    finally:
-        conn.close()
 
 
+SQL_GET_UNIT_ANNOUNCEMENTS = q("""
+    SELECT id, unit_id, title, body, created_by, created_at
+    FROM unit_announcements WHERE unit_id = %s
+    ORDER BY created_at DESC LIMIT %s
+""")
+UNIT_ANNOUNCEMENT_KEYS = ('id', 'unit_id', 'title', 'body', 'created_by', 'created_at')
+
 def get_unit_announcements(unit_id, limit=50):
     """
     Fetch announcements for a unit (most recent first).
     Used by templates (e.g., unit_detail).
     """
     _ensure_announce_attendance_tables()
-    conn = get_db()
-    cur = conn.cursor()
     try:
-        if os.environ.get('DATABASE_URL'):
-            cur.execute(
-                "SELECT id, unit_id, title, body, created_by, created_at "
-                "FROM unit_announcements WHERE unit_id = %s "
-                "ORDER BY created_at DESC LIMIT %s",
-                (unit_id, limit)
-            )
-        else:
-            cur.execute(
-                "SELECT id, unit_id, title, body, created_by, created_at "
-                "FROM unit_announcements WHERE unit_id = ? "
-                "ORDER BY created_at DESC LIMIT ?",
-                (unit_id, limit)
-            )
-        rows = cur.fetchall()
-        out = []
-        for r in rows:
-            if hasattr(r, 'keys'):
-                d = dict(r)
-            else:
-                d = {
-                    'id': r[0], 'unit_id': r[1], 'title': r[2],
-                    'body': r[3], 'created_by': r[4] if len(r) > 4 else None,
-                    'created_at': r[5] if len(r) > 5 else None
-                }
-            out.append(d)
-        return out
+        with db_cursor() as (conn, cur):
+            cur.execute(SQL_GET_UNIT_ANNOUNCEMENTS, (unit_id, limit))
+            return [dict(zip(UNIT_ANNOUNCEMENT_KEYS, r)) for r in cur]
     except Exception as e:
-        print(f"Error get_unit_announcements: {e}")
+        logger.error("Error get_unit_announcements: %s", e)
         return []
-    finally:
-        conn.close()
 
 
+SQL_SET_UNIT_ATTENDANCE = q("""
+    INSERT INTO unit_attendance (unit_id, is_open, updated_at)
+    VALUES (%s, %s, NOW())
+    ON CONFLICT (unit_id)
+    DO UPDATE SET is_open = excluded.is_open, updated_at = NOW()
+""")
+
 def set_unit_attendance_open(unit_id, is_open: bool):
     """
     Open/close attendance for a unit (upsert).
     Called by: POST /lecturer/unit/<unit_id>/attendance-toggle
     """
     _ensure_announce_attendance_tables()
-    conn = get_db()
-    cur = conn.cursor()
     try:
-        if os.environ.get('DATABASE_URL'):
-            # PostgreSQL upsert
-            cur.execute("""
-                INSERT INTO unit_attendance (unit_id, is_open, updated_at)
-                VALUES (%s, %s, NOW())
-                ON CONFLICT (unit_id)
-                DO UPDATE SET is_open = EXCLUDED.is_open, updated_at = NOW()
-            """, (unit_id, bool(is_open)))
-        else:
-            # SQLite upsert via INSERT OR REPLACE; need current timestamp
-            cur.execute("""
-                INSERT OR REPLACE INTO unit_attendance (unit_id, is_open, updated_at)
-                VALUES (?, ?, datetime('now'))
-            """, (unit_id, 1 if is_open else 0))
-        conn.commit()
+        with db_cursor() as (conn, cur):
+            cur.execute(SQL_SET_UNIT_ATTENDANCE, (unit_id, bool(is_open)))
+            conn.commit()
         return True
     except Exception as e:
-        try:
-            conn.rollback()
-        except Exception:
-            pass
-        print(f"Error set_unit_attendance_open: {e}")
+        logger.error("Error set_unit_attendance_open: %s", e)
         return False
-    finally:
-        conn.close()
 
 
+SQL_UNIT_ATTENDANCE_OPEN = q("SELECT is_open FROM unit_attendance WHERE unit_id = %s")
+
 def is_unit_attendance_open(unit_id) -> bool:
     """
     Helper to read current attendance state for a unit.
     """
     _ensure_announce_attendance_tables()
-    conn = get_db()
-    cur = conn.cursor()
     try:
-        if os.environ.get('DATABASE_URL'):
-            cur.execute("SELECT is_open FROM unit_attendance WHERE unit_id = %s", (unit_id,))
-        else:
-            cur.execute("SELECT is_open FROM unit_attendance WHERE unit_id = ?", (unit_id,))
-        row = cur.fetchone()
+        with db_cursor() as (conn, cur):
+            cur.execute(SQL_UNIT_ATTENDANCE_OPEN, (unit_id,))
+            row = cur.fetchone()
         if not row:
             return False
-        val = row[0] if not hasattr(row, 'keys') else row['is_open']
+        val = row['is_open']
         # Some drivers return 't'/'f' for booleans; normalize
         if isinstance(val, str):
             return val.lower() in ('1', 't', 'true', 'yes')
         return bool(val)
     except Exception as e:
-        print(f"Error is_unit_attendance_open: {e}")
+        logger.error("Error is_unit_attendance_open: %s", e)
         return False
-    finally:
-        conn.close()
 
 
 def get_attendance_status_for_student(unit_id, student_id):
@@ -2559,30 +2875,19 @@ def get_attendance_status_for_student(unit_id, student_id):
         'counts': {'marked': X, 'total_registered': Y}
       }
     """
-    session = get_open_attendance_session(unit_id)
-    if not session:
+    try:
+        with db_cursor() as (conn, cursor):
+            _execute_prepared(cursor, 'attendance_status', (student_id, unit_id))
+            row = cursor.fetchone()
+    except Exception as e:
+        logger.error("Error getting attendance status for student: %s", e)
+        row = None
+    if not row:
         return {'open_session': None, 'has_marked': False, 'counts': {'marked': 0, 'total_registered': 0}}
 
-    conn = get_db()
-    cursor = conn.cursor()
-    try:
-        if os.environ.get('DATABASE_URL'):
-            cursor.execute("""
-                SELECT 1 FROM attendance_marks
-                WHERE session_id = %s AND student_id = %s
-                LIMIT 1
-            """, (session['id'], student_id))
-        else:
-            cursor.execute("""
-                SELECT 1 FROM attendance_marks
-                WHERE session_id = ? AND student_id = ?
-                LIMIT 1
-            """, (session['id'], student_id))
-        marked = cursor.fetchone() is not None
-        counts = get_attendance_counts(session['id'])
-        return {'open_session': session, 'has_marked': marked, 'counts': counts}
-    except Exception as e:
-        print(f"Error getting attendance status for student: {e}")
-        return {'open_session': session, 'has_marked': False, 'counts': {'marked': 0, 'total_registered': 0}}
-    finally:
-        conn.close()
+    # zip stops after the session columns; the computed ones are read by name
+    session = dict(zip(ATTENDANCE_SESSION_KEYS, row))
+    counts = {'marked': row['marked'], 'total_registered': row['total_registered']}
+    has_marked = bool(row['has_marked'])
+    session['is_open'] = bool(session['is_open'])
+    return {'open_session': session, 'has_marked': has_marked, 'counts': counts}
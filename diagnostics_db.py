@@ -1,6 +1,7 @@
 from database import get_db, init_db
 import sqlite3
 import os
+import secrets
 
 def diagnose_admin_login_issue():
     print("=== Diagnosing Admin Login Issue ===\n")
@@ -94,13 +95,15 @@ def diagnose_admin_login_issue():
 
 def create_default_admin():
     """Create a default admin account if none exists"""
-    from database import create_admin
+    from database import create_super_admin
+    # Generated once and shown only here, so no shared default password ever exists
+    password = secrets.token_urlsafe(12)
     try:
-        success = create_admin('admin@university.edu', 'admin123')
-        if success:
-            print("✓ Default admin account created: admin@university.edu / admin123")
+        # Returns the new id, or None when the email is already registered
+        if create_super_admin('admin@university.edu', password):
+            print(f"✓ Default admin account created: admin@university.edu / {password}")
         else:
-            print("✗ Failed to create default admin account")
+            print("ℹ️ Default admin account already exists: admin@university.edu")
     except Exception as e:
         print(f"✗ Error creating default admin: {e}")
 
@@ -4,6 +4,15 @@ import re
 from datetime import datetime, timedelta
 import secrets
 import string
+from functools import lru_cache
+import pyotp
+from werkzeug.security import check_password_hash
+
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
+
+# argon2-cffi releases the GIL while hashing, so other request threads keep running
+_argon2 = PasswordHasher(time_cost=2, memory_cost=19456, parallelism=1)
 
 # Password strength validation
 def validate_password_strength(password):
@@ -78,4 +87,37 @@ def record_failed_attempt(ip_address):
 def clear_login_attempts(ip_address):
     """Clear failed attempts on successful login"""
     if ip_address in failed_attempts:
-        del failed_attempts[ip_address]
\ No newline at end of file
+        del failed_attempts[ip_address]
+
+# TOTP helpers
+def normalize_totp_code(totp_code):
+    """Coerce a submitted TOTP code to a fixed-width 6-digit string"""
+    # Malformed input still goes through the same HMAC check as a wrong code
+    code = (totp_code or '').strip().zfill(6)[-6:]
+    if not code.isdigit():
+        code = '000000'
+    return code
+
+@lru_cache(maxsize=1024)
+def get_totp(totp_secret):
+    """Return a cached TOTP object for a secret (skips re-decoding the Base32 secret)"""
+    return pyotp.TOTP(totp_secret)
+
+# Password hashing
+def hash_password(password):
+    """Hash a password with Argon2id"""
+    return _argon2.hash(password)
+
+def check_password(stored_hash, password):
+    """Return (matches, needs_rehash) for a stored Argon2 or legacy werkzeug hash"""
+    if not stored_hash:
+        return False, False
+    if stored_hash.startswith('$argon2'):
+        try:
+            _argon2.verify(stored_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False, False
+        return True, _argon2.check_needs_rehash(stored_hash)
+    matches = check_password_hash(stored_hash, password)
+    # Legacy PBKDF2/scrypt hashes are upgraded on the next successful login
+    return matches, matches